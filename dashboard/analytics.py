@@ -12,7 +12,8 @@ from datetime import timedelta
 from collections import defaultdict
 
 # Предполагаем, что модель логов называется FactLog и находится в приложении log_analytics
-from logparser.models import FactLog
+from logparser.models import DailyTopValues, DimIP, DimRequest, FactLog
+from logparser.aggregates import TOP_WATERMARK, aggregates_are_current, top_values_over_range
 
 
 class LogAnalytics:
@@ -146,12 +147,29 @@ class LogAnalytics:
 
         return data
 
+    @staticmethod
+    def can_use_top_values(filters):
+        """
+        Можно ли ответить на запрос топа по дневным сводкам DailyTopValues:
+        из фильтров заданы только даты и сводки учитывают все записи FactLog.
+        Пустые поля формы (и limit - он не фильтрует записи) не учитываются.
+        """
+        active = {key for key, value in filters.items() if value not in (None, '', []) and key != 'limit'}
+        return active <= {'start_date', 'end_date'} and aggregates_are_current(TOP_WATERMARK)
+
     @classmethod
     def get_top_endpoints(cls, filters=None, limit=10):
         """Возвращает самые популярные эндпоинты."""
         if filters is None:
             filters = {}
 
+        if cls.can_use_top_values(filters):
+            rows = top_values_over_range(DailyTopValues.ENDPOINT, limit, filters.get('start_date'),
+                                         filters.get('end_date'), avg_time=Avg('response_time'))
+            requests = DimRequest.objects.in_bulk([row['value'] for row in rows])
+            return [{'method': requests[row['value']].method, 'path': requests[row['value']].path,
+                     'count': row['count'], 'avg_time': row['avg_time']} for row in rows]
+
         queryset = LogEntry.objects.all()
         queryset = cls.apply_filters(queryset, filters)
 
@@ -196,6 +214,11 @@ class LogAnalytics:
         if filters is None:
             filters = {}
 
+        if cls.can_use_top_values(filters):
+            rows = top_values_over_range(DailyTopValues.USER_AGENT, limit, filters.get('start_date'),
+                                         filters.get('end_date'))
+            return [{'user_agent': row['value'], 'count': row['count']} for row in rows]
+
         queryset = LogEntry.objects.all()
         queryset = cls.apply_filters(queryset, filters)
 
@@ -211,6 +234,13 @@ class LogAnalytics:
         if filters is None:
             filters = {}
 
+        if cls.can_use_top_values(filters):
+            rows = top_values_over_range(DailyTopValues.IP, limit, filters.get('start_date'),
+                                         filters.get('end_date'), avg_time=Avg('response_time'))
+            ips = DimIP.objects.in_bulk([row['value'] for row in rows])
+            return [{'ip_address': ips[row['value']].ip_address, 'count': row['count'],
+                     'avg_time': row['avg_time']} for row in rows]
+
         queryset = LogEntry.objects.all()
         queryset = cls.apply_filters(queryset, filters)
 
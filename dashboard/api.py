@@ -0,0 +1,143 @@
+"""
+JSON-данные дашборда: ряды по дням, распределение классов статусов, топы
+эндпоинтов, IP и user-agent и постраничный список записей лога. Фильтры -
+те же параметры GET, что и у панели (get_log_filters). Ответы графиков
+снабжаются ETag из набора фильтров и номера поколения загрузки: при
+неизменных данных запрос с If-None-Match получает 304 без запросов к данным
+и без рендеринга.
+"""
+import hashlib
+from collections import Counter
+
+from django.db.models import Avg, Count, F
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from logparser.aggregates import TOP_FACT_FIELDS, TOP_WATERMARK, aggregates_are_current, top_values_over_range
+from logparser.models import DailyTopValues, DimIP, DimRequest
+from .result_cache import cached_result, result_cache_key
+from .views import (
+    filter_logs, get_log_filters, log_page, log_record, only_date_filters, panel_series, status_counts_by_date,
+)
+
+TOP_KINDS = {
+    'endpoints': DailyTopValues.ENDPOINT,
+    'ips': DailyTopValues.IP,
+    'user-agents': DailyTopValues.USER_AGENT,
+}
+TOP_DEFAULT_LIMIT = 10
+TOP_MAX_LIMIT = 100
+
+
+def chart_filters(request, kind=None):
+    """
+    Фильтры запроса к API (None, если не задан диапазон дат). Для топов к ним
+    добавляются вид топа и limit - они тоже входят в ключ кэша и ETag.
+    """
+    if kind is not None and kind not in TOP_KINDS:
+        raise Http404("Неизвестный топ")
+    filters = get_log_filters(request)
+    if filters is None or kind is None:
+        return filters
+    try:
+        limit = int(request.GET.get('limit', TOP_DEFAULT_LIMIT))
+    except ValueError:
+        limit = TOP_DEFAULT_LIMIT
+    return dict(filters, kind=kind, limit=max(1, min(limit, TOP_MAX_LIMIT)))
+
+
+def chart_etag(namespace):
+    """etag_func для condition: хэш ключа кэша результата (фильтры + поколение загрузки)."""
+    def etag_func(request, kind=None):
+        filters = chart_filters(request, kind)
+        if filters is None:
+            return None
+        return hashlib.sha1(result_cache_key(namespace, filters).encode()).hexdigest()
+    return etag_func
+
+
+def missing_dates():
+    return JsonResponse({"error": "Не задан диапазон дат (start_date, end_date)"}, status=400)
+
+
+@require_GET
+@condition(etag_func=chart_etag('panel'))
+def time_series(request):
+    """Запросы по дням: всего и по классам статусов (те же ряды, что и на панели)."""
+    filters = chart_filters(request)
+    if filters is None:
+        return missing_dates()
+    series = cached_result('panel', filters, lambda: panel_series(request, filters))
+    return JsonResponse({
+        "labels": series['date_labels'],
+        "total": series['month_stats'],
+        **{f"{status_class}xx": series[f'errors{status_class}'] for status_class in range(1, 6)},
+    })
+
+
+def status_distribution(request):
+    by_class = Counter()
+    for _, status_code, count in status_counts_by_date(request):
+        by_class[f"{status_code // 100}xx"] += count
+    by_class = dict(sorted(by_class.items()))
+    return {"labels": list(by_class), "values": list(by_class.values())}
+
+
+@require_GET
+@condition(etag_func=chart_etag('status_distribution'))
+def status_chart(request):
+    """Распределение запросов по классам статусов за период."""
+    filters = chart_filters(request)
+    if filters is None:
+        return missing_dates()
+    return JsonResponse(cached_result('status_distribution', filters, lambda: status_distribution(request)))
+
+
+def top_list(request, filters):
+    """
+    Топ значений за период: по дневным сводкам DailyTopValues, если заданы
+    только даты и сводки актуальны, иначе группировкой отфильтрованных FactLog.
+    """
+    dimension = TOP_KINDS[filters['kind']]
+    if only_date_filters(filters) and aggregates_are_current(TOP_WATERMARK):
+        rows = top_values_over_range(dimension, filters['limit'], filters['start_date'], filters['end_date'],
+                                     avg_time=Avg('response_time'))
+    else:
+        rows = list(filter_logs(request).values(value=F(TOP_FACT_FIELDS[dimension]))
+                    .annotate(count=Count('id'), avg_time=Avg('response_time'))
+                    .order_by('-count')[:filters['limit']])
+
+    values = [row['value'] for row in rows]
+    if dimension == DailyTopValues.ENDPOINT:
+        labels = {pk: str(endpoint) for pk, endpoint in DimRequest.objects.in_bulk(values).items()}
+    elif dimension == DailyTopValues.IP:
+        labels = {pk: ip.ip_address for pk, ip in DimIP.objects.in_bulk(values).items()}
+    else:
+        labels = {value: value for value in values}
+    return [{"label": labels[row['value']], "count": row['count'], "avg_time": row['avg_time']} for row in rows]
+
+
+@require_GET
+@condition(etag_func=chart_etag('top'))
+def top_chart(request, kind):
+    """Топ эндпоинтов, IP или user-agent (kind) за период; ?limit= - сколько значений."""
+    filters = chart_filters(request, kind)
+    if filters is None:
+        return missing_dates()
+    return JsonResponse({"items": cached_result('top', filters, lambda: top_list(request, filters))})
+
+
+@require_GET
+def log_list(request):
+    """
+    Записи лога с фильтрами панели, постранично по курсору id (см. log_page):
+    next и previous - значения для параметров after и before соседних страниц.
+    """
+    page = log_page(request)
+    if page is None:
+        return missing_dates()
+    return JsonResponse({
+        "items": [log_record(fact) for fact in page['rows']],
+        "next": page['next'],
+        "previous": page['previous'],
+    })
@@ -0,0 +1,168 @@
+"""
+Фоновая обработка загруженных через дашборд лог-файлов: HTTP-запрос только
+принимает файл и ставит задание UploadJob в очередь, а загрузку в БД
+выполняет пул потоков этого же процесса.
+"""
+import os
+import socket
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from logparser.ingest import file_fingerprint
+from logparser.management.commands.load_logs import process_log_stream
+from logparser.parse_utils import READ_BLOCK_SIZE
+from .models import UploadJob
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def current_worker():
+    """Идентификатор текущего процесса для UploadJob.worker."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def process_exists(pid):
+    """
+    Жив ли процесс pid на этом хосте. На Windows os.kill(pid, 0) посылает
+    Ctrl+C, поэтому там процесс всегда считается живым.
+    """
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_orphaned_jobs():
+    """
+    Помечает ошибкой незавершённые задания, процесс которых на этом хосте уже
+    завершился (сервер перезапущен). Задания живых процессов - других воркеров
+    того же сервера или других хостов - не трогаются. Вызывается до создания
+    пула этого процесса.
+    """
+    host = socket.gethostname()
+    me = current_worker()
+    orphaned = []
+    for job_id, worker in UploadJob.objects.filter(
+            status__in=[UploadJob.QUEUED, UploadJob.RUNNING],
+            worker__startswith=f"{host}:").values_list('pk', 'worker'):
+        pid = worker.rpartition(':')[2]
+        # Пул ещё не создан - задания с нашим pid остались от прежнего процесса с тем же pid
+        if worker == me or not pid.isdigit() or not process_exists(int(pid)):
+            orphaned.append(job_id)
+    if orphaned:
+        UploadJob.objects.filter(pk__in=orphaned).update(
+            status=UploadJob.FAILED, error="Прервано перезапуском сервера", finished_at=timezone.now())
+
+
+def get_executor():
+    """
+    Пул потоков для заданий загрузки (создаётся при первом задании).
+    По умолчанию один поток: SQLite всё равно выполняет записи по очереди.
+    При создании пула задания завершившихся процессов помечаются ошибкой.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            fail_orphaned_jobs()
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'LOGPARSER_UPLOAD_WORKERS', 1),
+                                           thread_name_prefix='log-upload')
+        return _executor
+
+
+def take_uploaded_file(uploaded_file):
+    """
+    Забирает временный файл, в который Django уже сохранил большую загрузку
+    (TemporaryUploadedFile): файл переносится под своё имя без копирования
+    и удаляется заданием после обработки. Исходное имя остаётся в конце пути -
+    по нему определяется сервер (server_for_file).
+    """
+    source = uploaded_file.temporary_file_path()
+    fd, path = tempfile.mkstemp(prefix='log-upload-', suffix='-' + os.path.basename(uploaded_file.name),
+                                dir=os.path.dirname(source))
+    os.close(fd)
+    file_move_safe(source, path, allow_overwrite=True)
+    return path
+
+
+def submit_upload(uploaded_file):
+    """
+    Создаёт задание для загруженного файла и ставит его в очередь.
+    Большой файл, уже сохранённый Django на диск, забирается без копирования,
+    небольшой файл из памяти - списком блоков chunks(). В обоих случаях данные
+    разбираются потоком (process_log_stream) с одним правилом журнала
+    IngestedFile: повторная загрузка тех же данных пропускается.
+    """
+    executor = get_executor()
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        job = UploadJob.objects.create(file_name=uploaded_file.name, worker=current_worker(),
+                                       file_path=take_uploaded_file(uploaded_file))
+        executor.submit(run_upload_job, job.pk)
+    else:
+        # Данные нужно прочитать сейчас: после ответа Django закроет загруженный файл
+        data = list(uploaded_file.chunks())
+        job = UploadJob.objects.create(file_name=uploaded_file.name, worker=current_worker())
+        executor.submit(run_upload_job, job.pk, data)
+    return job
+
+
+def run_upload_job(job_id, data=None):
+    """
+    Выполняется в потоке пула: загружает файл задания (или блоки data,
+    если файла нет) и обновляет прогресс задания. Если эти данные уже были
+    загружены, задание получает состояние SKIPPED.
+    """
+    jobs = UploadJob.objects.filter(pk=job_id)
+    job = jobs.first()
+    try:
+        if job is None:
+            return
+        jobs.update(status=UploadJob.RUNNING, started_at=timezone.now())
+
+        def progress(lines_count):
+            jobs.update(lines_processed=F('lines_processed') + lines_count)
+
+        inline_aggregates = getattr(settings, 'LOGPARSER_INLINE_AGGREGATES', False)
+        if job.file_path:
+            with open(job.file_path, 'rb') as f:
+                loaded = process_log_stream(iter(lambda: f.read(READ_BLOCK_SIZE), b''), job.file_name,
+                                            progress=progress, inline_aggregates=inline_aggregates,
+                                            fingerprint=file_fingerprint(job.file_path))
+        else:
+            loaded = process_log_stream(data, job.file_name, progress=progress, inline_aggregates=inline_aggregates)
+        jobs.update(status=UploadJob.DONE if loaded is not None else UploadJob.SKIPPED,
+                    finished_at=timezone.now())
+    except Exception as exc:
+        jobs.update(status=UploadJob.FAILED, error=str(exc), finished_at=timezone.now())
+    finally:
+        if job is not None and job.file_path and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        # Соединение с БД принадлежит потоку пула - закрываем его сами
+        connection.close()
+
+
+def job_status(job):
+    """Состояние задания для JSON-ответа страницы загрузки."""
+    elapsed = job.elapsed_seconds(timezone.now())
+    return {
+        "id": job.pk,
+        "file_name": job.file_name,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "lines_processed": job.lines_processed,
+        "elapsed": round(elapsed, 1),
+        "lines_per_second": round(job.lines_processed / elapsed) if elapsed else 0,
+        "error": job.error,
+    }
@@ -1 +1,40 @@
-from django.db import models
\ No newline at end of file
+from django.db import models
+
+
+class UploadJob(models.Model):
+    """
+    Фоновая загрузка лог-файла, принятого через форму upload-log:
+    состояние задания и прогресс для страницы загрузки.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Обрабатывается'),
+        (DONE, 'Готово'),
+        (SKIPPED, 'Уже загружен'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    file_name       = models.CharField(max_length=255)
+    # Пусто, если файл был загружен в память и разбирается без записи на диск
+    file_path       = models.CharField(max_length=1024, blank=True)
+    # Процесс, в пуле которого выполняется задание: "хост:pid"
+    worker          = models.CharField(max_length=100, blank=True)
+    status          = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    lines_processed = models.BigIntegerField(default=0)
+    error           = models.TextField(blank=True)
+    created_at      = models.DateTimeField(auto_now_add=True)
+    started_at      = models.DateTimeField(null=True, blank=True)
+    finished_at     = models.DateTimeField(null=True, blank=True)
+
+    def elapsed_seconds(self, now):
+        if self.started_at is None:
+            return 0.0
+        return ((self.finished_at or now) - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"{self.file_name} ({self.get_status_display()})"
@@ -0,0 +1,53 @@
+"""
+Кэш результатов запросов дашборда. Ключ строится из нормализованного набора
+фильтров (даты, статусы, методы, браузеры, ОС, группировка по времени, метрика)
+и номера поколения загрузки: после загрузки новых данных прежние результаты
+больше не находятся и вытесняются кэшем Django по TTL или при переполнении.
+"""
+import hashlib
+import json
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+
+from logparser.aggregates import current_generation
+
+
+def normalize_filters(filters):
+    """
+    Приводит фильтры к каноническому виду: пустые значения отбрасываются,
+    списки сортируются, даты - в ISO. Одинаковые по смыслу наборы фильтров
+    (в том числе с другим порядком значений в запросе) дают одинаковый ключ.
+    """
+    normalized = {}
+    for name, value in filters.items():
+        if value in (None, '', [], ()):
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(item) for item in value)
+        elif isinstance(value, date):
+            value = value.isoformat()
+        else:
+            value = str(value)
+        normalized[name] = value
+    return normalized
+
+
+def result_cache_key(namespace, filters):
+    digest = hashlib.sha1(json.dumps(normalize_filters(filters), sort_keys=True).encode()).hexdigest()
+    return f"dashboard:{namespace}:{current_generation()}:{digest}"
+
+
+def cached_result(namespace, filters, compute):
+    """
+    Результат compute() для набора фильтров filters из кэша; при промахе
+    вычисляется и сохраняется на LOGPARSER_RESULT_CACHE_TIMEOUT секунд.
+    namespace отделяет результаты разных представлений.
+    """
+    key = result_cache_key(namespace, filters)
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, getattr(settings, 'LOGPARSER_RESULT_CACHE_TIMEOUT', 600))
+    return result
@@ -0,0 +1,268 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+from unittest import skipIf
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from dashboard.analytics import LogAnalytics
+from dashboard.forms import LogFilterForm
+from dashboard.jobs import current_worker, fail_orphaned_jobs
+from dashboard.models import UploadJob
+from dashboard.views import EXPORT_HEADER
+from logparser.aggregates import TOP_WATERMARK, bump_generation, update_aggregates
+from logparser.models import AggregateWatermark, DimDateTime, DimIP, DimRequest, FactLog
+
+
+def create_facts(rows, ip_address='10.0.0.1'):
+    """
+    Создаёт записи FactLog с адреса ip_address по кортежам (дата, status_code, метод) -
+    по одному измерению на значение. Возвращает id созданных записей по порядку.
+    """
+    ip, _ = DimIP.objects.get_or_create(ip_address=ip_address)
+    facts = []
+    for log_date, status_code, method in rows:
+        moment, _ = DimDateTime.objects.get_or_create(
+            log_date=log_date, log_time=datetime.time(12, 0), utc_offset='+0300', year=log_date.year,
+            month=log_date.month, day=log_date.day, hour=12, minute=0, second=0)
+        request, _ = DimRequest.objects.get_or_create(method=method, path='/api/item', http_version='HTTP/1.1')
+        facts.append(FactLog(ip=ip, datetime_entry=moment, request=request, status_code=status_code,
+                             bytes_sent=100, referrer='-', user_agent='bench', server='Server A'))
+    return [fact.id for fact in FactLog.objects.bulk_create(facts)]
+
+
+@override_settings(ROOT_URLCONF='dashboard.urls')
+class DashboardTestCase(TestCase):
+    """Данные за 1-3 марта 2024: по четыре запроса в день, из них один 404 и один POST."""
+
+    DATES = {'start_date': '2024-03-01', 'end_date': '2024-03-03'}
+
+    def setUp(self):
+        # Результаты кэшируются под номером поколения, а он в каждом тесте начинается заново
+        cache.clear()
+        rows = []
+        for day in (1, 2, 3):
+            log_date = datetime.date(2024, 3, day)
+            rows += [(log_date, 200, 'GET'), (log_date, 200, 'GET'), (log_date, 404, 'GET'),
+                     (log_date, 201, 'POST')]
+        self.ids = create_facts(rows)
+
+
+class ChartETagTests(DashboardTestCase):
+    """ETag графиков: 304 при неизменных данных, новый ETag после загрузки."""
+
+    def test_repeated_request_not_modified(self):
+        for url in ('/api/charts/status/', '/api/charts/time-series/', '/api/charts/top/endpoints/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, self.DATES)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                response = self.client.get(url, self.DATES, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_etag_depends_on_filters(self):
+        first = self.client.get('/api/charts/status/', self.DATES)['ETag']
+        other = self.client.get('/api/charts/status/', dict(self.DATES, http_method='POST'))['ETag']
+        self.assertNotEqual(first, other)
+        top = self.client.get('/api/charts/top/endpoints/', self.DATES)['ETag']
+        self.assertNotEqual(top, self.client.get('/api/charts/top/endpoints/', dict(self.DATES, limit=5))['ETag'])
+
+    def test_etag_changes_after_ingest(self):
+        response = self.client.get('/api/charts/status/', self.DATES)
+        etag = response['ETag']
+        self.assertEqual(response.json()['values'], [9, 3])
+        create_facts([(datetime.date(2024, 3, 2), 500, 'GET')])
+        bump_generation()
+        response = self.client.get('/api/charts/status/', self.DATES, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json(), {'labels': ['2xx', '4xx', '5xx'], 'values': [9, 3, 1]})
+
+    def test_missing_dates(self):
+        response = self.client.get('/api/charts/status/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class CanUseTopValuesTests(TestCase):
+    """Топ по дневным сводкам используется для формы, где заданы только даты."""
+
+    def setUp(self):
+        update_aggregates(TOP_WATERMARK)
+
+    def cleaned(self, **data):
+        form = LogFilterForm(data={'start_date': '2024-03-01', 'end_date': '2024-03-10', 'limit': 100, **data})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.cleaned_data
+
+    def test_only_dates(self):
+        self.assertTrue(LogAnalytics.can_use_top_values(self.cleaned()))
+        self.assertTrue(LogAnalytics.can_use_top_values({}))
+
+    def test_other_filters(self):
+        for data in ({'ip_address': '10.0.0.1'}, {'status_code': '4xx'}, {'method': 'GET'},
+                     {'min_response_time': 0}):
+            with self.subTest(data=data):
+                self.assertFalse(LogAnalytics.can_use_top_values(self.cleaned(**data)))
+
+    def test_stale_aggregates(self):
+        cleaned = self.cleaned()
+        AggregateWatermark.objects.filter(name=TOP_WATERMARK).update(last_fact_id=1)
+        self.assertFalse(LogAnalytics.can_use_top_values(cleaned))
+
+
+class OrphanedJobsTests(TestCase):
+    """При создании пула ошибкой помечаются только задания завершившихся процессов."""
+
+    @skipIf(os.name == 'nt', "на Windows процессы всегда считаются живыми")
+    def test_only_dead_workers_on_this_host(self):
+        host = socket.gethostname()
+        finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                  capture_output=True, text=True, check=True)
+        dead_pid = int(finished.stdout)
+        jobs = {
+            'dead': UploadJob.objects.create(file_name='a.log', worker=f"{host}:{dead_pid}",
+                                             status=UploadJob.RUNNING),
+            'same_pid': UploadJob.objects.create(file_name='b.log', worker=current_worker()),
+            'alive': UploadJob.objects.create(file_name='c.log', worker=f"{host}:{os.getppid()}",
+                                              status=UploadJob.RUNNING),
+            'other_host': UploadJob.objects.create(file_name='d.log', worker=f"other-{host}:{dead_pid}"),
+            'done': UploadJob.objects.create(file_name='e.log', worker=f"{host}:{dead_pid}",
+                                             status=UploadJob.DONE),
+        }
+        fail_orphaned_jobs()
+        statuses = {name: UploadJob.objects.get(pk=job.pk).status for name, job in jobs.items()}
+        self.assertEqual(statuses, {'dead': UploadJob.FAILED, 'same_pid': UploadJob.FAILED,
+                                    'alive': UploadJob.RUNNING, 'other_host': UploadJob.QUEUED,
+                                    'done': UploadJob.DONE})
+
+
+class ExportTests(DashboardTestCase):
+    """Потоковая выгрузка /export/: CSV, NDJSON и сжатие gzip."""
+
+    def export(self, **params):
+        response = self.client.get('/export/', dict(self.DATES, **params))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename=export.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(tuple(rows[0]), EXPORT_HEADER)
+        self.assertEqual([int(row[0]) for row in rows[1:]], self.ids)
+
+    def test_csv_respects_filters(self):
+        for params, expected in (({'status': '404'}, 3), ({'http_method': 'POST'}, 3), ({'status': '2**'}, 9),
+                                 ({'start_date': '2024-03-02', 'end_date': '2024-03-02'}, 4)):
+            with self.subTest(params=params):
+                _, body = self.export(**params)
+                rows = list(csv.reader(io.StringIO(body.decode())))
+                self.assertEqual(len(rows) - 1, expected)
+
+    def test_ndjson(self):
+        response, body = self.export(format='ndjson', http_method='POST')
+        self.assertIn('filename=export.ndjson', response['Content-Disposition'])
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(list(records[0]), list(EXPORT_HEADER))
+        self.assertEqual({record['status_code'] for record in records}, {201})
+
+    def test_gzip(self):
+        _, plain = self.export()
+        for export_format in ('csv', 'ndjson'):
+            with self.subTest(format=export_format):
+                response, body = self.export(format=export_format, compress='gzip')
+                self.assertEqual(response['Content-Type'], 'application/gzip')
+                self.assertIn(f'filename=export.{export_format}.gz', response['Content-Disposition'])
+                data = gzip.decompress(body)
+                if export_format == 'csv':
+                    self.assertEqual(data, plain)
+                else:
+                    self.assertEqual(len(data.decode().splitlines()), len(self.ids))
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get('/export/', dict(self.DATES, format='xml')).status_code, 400)
+        self.assertEqual(self.client.get('/export/', dict(self.DATES, compress='zip')).status_code, 400)
+
+
+class LogPaginationTests(DashboardTestCase):
+    """Keyset-пагинация записей: /api/logs/ и страница /logs/."""
+
+    def page(self, **params):
+        response = self.client.get('/api/logs/', dict(self.DATES, **params))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk_forward(self, **params):
+        pages = [self.page(limit=5, **params)]
+        while pages[-1]['next'] is not None:
+            pages.append(self.page(limit=5, after=pages[-1]['next'], **params))
+        return pages
+
+    def test_forward_pages_cover_all_rows(self):
+        pages = self.walk_forward()
+        self.assertEqual([len(page['items']) for page in pages], [5, 5, 2])
+        ids = [item['id'] for page in pages for item in page['items']]
+        # Без дублей и пропусков на границах страниц
+        self.assertEqual(ids, self.ids)
+        self.assertIsNone(pages[0]['previous'])
+        for page in pages[:-1]:
+            self.assertEqual(page['next'], page['items'][-1]['id'])
+        self.assertIsNone(pages[-1]['next'])
+
+    def test_previous_cursor_returns_previous_page(self):
+        pages = self.walk_forward()
+        for current, previous in zip(pages[1:], pages):
+            back = self.page(limit=5, before=current['previous'])
+            self.assertEqual(back['items'], previous['items'])
+            self.assertEqual(back['previous'], previous['previous'])
+            # С предыдущей страницы курсор next снова ведёт на текущую
+            self.assertEqual(self.page(limit=5, after=back['next'])['items'], current['items'])
+
+    def test_pages_respect_filters(self):
+        pages = self.walk_forward(status='200')
+        ids = [item['id'] for page in pages for item in page['items']]
+        self.assertEqual(ids, [fact_id for i, fact_id in enumerate(self.ids) if i % 4 in (0, 1)])
+        self.assertEqual([len(page['items']) for page in pages], [5, 1])
+
+    def test_empty_result(self):
+        for params in ({'status': '500'}, {'start_date': '2024-04-01', 'end_date': '2024-04-30'},
+                       {'after': self.ids[-1]}, {'before': self.ids[0]}):
+            with self.subTest(params=params):
+                self.assertEqual(self.page(**params), {'items': [], 'next': None, 'previous': None})
+
+    def test_missing_dates(self):
+        self.assertEqual(self.client.get('/api/logs/').status_code, 400)
+
+    def test_explorer_page(self):
+        response = self.client.get('/logs/', dict(self.DATES, limit=5, after=self.ids[4]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([record['id'] for record in response.context['records']], self.ids[5:10])
+        self.assertEqual(response.context['page']['next'], self.ids[9])
+        self.assertEqual(response.context['page']['previous'], self.ids[5])
+        self.assertNotIn('after=', response.context['query'])
+
+
+class PanelTests(DashboardTestCase):
+    """Основная панель /panel/."""
+
+    def test_unique_users_for_selected_period(self):
+        create_facts([(datetime.date(2024, 3, 3), 200, 'GET')], ip_address='10.0.0.2')
+        create_facts([(datetime.date(2024, 2, 1), 200, 'GET')], ip_address='10.0.0.3')
+        for params, expected in (({}, '3'), (self.DATES, '2'),
+                                 ({'start_date': '2024-03-01', 'end_date': '2024-03-02'}, '1')):
+            with self.subTest(params=params):
+                response = self.client.get('/panel/', params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['total_unique_users'], expected)
@@ -1,9 +1,15 @@
 # dashboard/urls.py
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('panel/', views.index_panel, name='panel'),
     path('export/', views.request_export, name='request_export'),
     path('upload-log/', views.index_upload_log, name='upload-log'),
+    path('upload-log/<int:job_id>/status/', views.upload_log_status, name='upload-log-status'),
+    path('logs/', views.log_explorer, name='log-explorer'),
+    path('api/logs/', api.log_list, name='api-logs'),
+    path('api/charts/time-series/', api.time_series, name='api-time-series'),
+    path('api/charts/status/', api.status_chart, name='api-status-chart'),
+    path('api/charts/top/<str:kind>/', api.top_chart, name='api-top-chart'),
     path('ExampleError/', views.ExampleError.as_view(), name='example-error'),]
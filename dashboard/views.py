@@ -1,25 +1,32 @@
-from django.shortcuts import render
-from django.http import HttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.generic import TemplateView
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
-import tempfile
 import random
 from django.db.models import Q
 
 from .forms import LogFilterForm, ChartConfigForm, LogUploadForm
 from .analytics import LogAnalytics
 from .visualizer import ChartVisualizer
-from logparser.management.commands.load_logs import process_log_file
-from logparser.models import FactLog  # Используем непосредственно FactLog для хранения логов
-from django.shortcuts import render, redirect
+from .jobs import job_status, submit_upload
+from .result_cache import cached_result
+from .models import UploadJob
+from logparser.models import DateStatusAggregate, FactLog, HourlyRollup  # Используем непосредственно FactLog для хранения логов
+from logparser.aggregates import (
+    DAILY_WATERMARK, HOURLY_WATERMARK, aggregates_are_current, headline_counters, unique_count,
+)
+from logparser.ingest import datetime_smart_key_range, use_datetime_smart_keys
 from django.urls import reverse
-from django.db.models import Count
+from django.db.models import Count, Sum
 from collections import defaultdict
 from django.conf import settings
 import os
 from datetime import date, timedelta, datetime
 import csv
+import io
+import json
+import zlib
 
 def daterange(start_date: date, end_date: date):
     days = int((end_date - start_date).days)
@@ -46,31 +53,24 @@ def get_sqlite_db_size():
     except OSError:
         return 0
 
-def filter_logs(request):
+def get_log_filters(request):
+    """
+    Разбирает параметры фильтров дашборда из GET-запроса. Возвращает словарь
+    (start_date, end_date, status_codes, methods, browsers, oses) или None,
+    если не задан диапазон дат.
+    """
     start_date_str = request.GET.get('start_date', None)
     end_date_str = request.GET.get('end_date', None)
+    if not (start_date_str and end_date_str):
+        return None
 
     status_values = request.GET.getlist('status', [])
-    # Handle wildcard for 1xx status codes
-    if "1**" in status_values:
-        status_values.remove("1**")
-        status_values.extend(range(100, 200))  # Add all status codes from 100-199
-    # Handle wildcard for 2xx status codes
-    if "2**" in status_values:
-        status_values.remove("2**")
-        status_values.extend(range(200, 300))  # Add all status codes from 200-299
-    # Handle wildcard for 3xx status codes
-    if "3**" in status_values:
-        status_values.remove("3**")
-        status_values.extend(range(300, 400))  # Add all status codes from 300-399
-    # Handle wildcard for 4xx status codes
-    if "4**" in status_values:
-        status_values.remove("4**")
-        status_values.extend(range(400, 500))  # Add all status codes from 400-499
-    # Handle wildcard for 5xx status codes
-    if "5**" in status_values:
-        status_values.remove("5**")
-        status_values.extend(range(500, 600))  # Add all status codes from 500-599
+    # Шаблоны классов статусов: "1**" - все коды 100-199, "2**" - 200-299 и т.д.
+    for status_class in range(1, 6):
+        wildcard = f"{status_class}**"
+        if wildcard in status_values:
+            status_values.remove(wildcard)
+            status_values.extend(range(status_class * 100, status_class * 100 + 100))
     method_values = request.GET.getlist('http_method', [])
 
     browser_values = request.GET.getlist('browser', [])
@@ -79,78 +79,122 @@ def filter_logs(request):
     os_values = request.GET.getlist('os', [])
     if os_values == ['']: os_values = []
 
+    return {
+        'start_date': datetime.strptime(start_date_str, "%Y-%m-%d").date(),
+        'end_date': datetime.strptime(end_date_str, "%Y-%m-%d").date(),
+        'status_codes': status_values,
+        'methods': method_values,
+        'browsers': browser_values,
+        'oses': os_values,
+    }
 
-    # Фильтрация по дню через связь с моделью DimDateTime (поле log_date)
-    if start_date_str and end_date_str:
+def filter_logs(request):
+    filters = get_log_filters(request)
+    if filters is None:
+        return None
+    start_date = filters['start_date']
+    end_date = filters['end_date']
+    # if int((end_date - start_date).days) > 365:
+    #     return HttpResponse("Too many days")
+
+    # Фильтрация по дню через связь с моделью DimDateTime (поле log_date).
+    # При вычисляемых ключах DimDateTime диапазон дат - это диапазон id, JOIN не нужен
+    if use_datetime_smart_keys():
+        first_key, last_key = datetime_smart_key_range(start_date, end_date)
+        date_filter = Q(datetime_entry_id__gte=first_key, datetime_entry_id__lte=last_key)
+    else:
+        date_filter = Q(datetime_entry__log_date__range=(start_date, end_date))
 
-        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-        end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-        # if int((end_date - start_date).days) > 365:
-        #     return HttpResponse("Too many days")
+    return FactLog.objects.filter(
+        *([Q(status_code__in=filters['status_codes'])] if filters['status_codes'] else []),
+        *([Q(request__method__in=filters['methods'])] if filters['methods'] else []),
+        *([Q(user_agent_detail__os_family__in=filters['oses'])] if filters['oses'] else []),
+        *([Q(user_agent_detail__browser_family__in=filters['browsers'])] if filters['browsers'] else []),
+        date_filter
+    )
 
-        all_objects = FactLog.objects.filter(
-                        *([Q(status_code__in=status_values)] if status_values else []),
-                        *([Q(request__method__in=method_values)] if method_values else []),
-                        *([Q(user_agent_detail__os_family__in=os_values)] if os_values else []),
-                        *([Q(user_agent_detail__browser_family__in=browser_values)] if browser_values else []),
-                        datetime_entry__log_date__range=(start_date, end_date)
-                    )
-        return all_objects
-    else:
+def filter_rollup(request):
+    """
+    Те же фильтры, что и filter_logs, но по почасовому кубу HourlyRollup.
+    Возвращает None, если диапазон дат не задан или куб отстаёт от FactLog
+    (тогда запрос нужно выполнять по фактам).
+    """
+    filters = get_log_filters(request)
+    if filters is None or not aggregates_are_current(HOURLY_WATERMARK):
         return None
+    return HourlyRollup.objects.filter(
+        *([Q(status_code__in=filters['status_codes'])] if filters['status_codes'] else []),
+        *([Q(method__in=filters['methods'])] if filters['methods'] else []),
+        *([Q(os_family__in=filters['oses'])] if filters['oses'] else []),
+        *([Q(browser_family__in=filters['browsers'])] if filters['browsers'] else []),
+        log_date__range=(filters['start_date'], filters['end_date']),
+    )
+
+def only_date_filters(filters):
+    """Заданы ли в фильтрах get_log_filters только даты."""
+    return not any(filters[name] for name in ('status_codes', 'methods', 'browsers', 'oses'))
+
+def status_counts_by_date(request):
+    """
+    Количество запросов по (дата, status_code) с учётом фильтров дашборда -
+    одним запросом. Без фильтров, кроме дат, строки берутся из
+    DateStatusAggregate, иначе из куба HourlyRollup; если агрегаты отстают
+    от FactLog - группировкой самих FactLog.
+    """
+    filters = get_log_filters(request)
+    if filters is None:
+        return []
+    if only_date_filters(filters) and aggregates_are_current(DAILY_WATERMARK):
+        return DateStatusAggregate.objects.filter(
+            log_date__range=(filters['start_date'], filters['end_date']),
+        ).values_list('log_date', 'status_code', 'count')
+    filtered_rollup = filter_rollup(request)
+    if filtered_rollup is not None:
+        return filtered_rollup.values_list('log_date', 'status_code').annotate(count=Sum('count')).order_by()
+    return (filter_logs(request).values_list('datetime_entry__log_date', 'status_code')
+            .annotate(count=Count('id')).order_by())
+
+def panel_series(request, filters):
+    """
+    Ряды графиков панели за период фильтров: запросы по дням (month_stats)
+    и по классам статусов (errors1..errors5) - из одной группировки по (дата, статус).
+    """
+    days = list(daterange(filters['start_date'], filters['end_date']))
+    date_count_dict = defaultdict(int)
+    class_counts = {status_class: defaultdict(int) for status_class in range(1, 6)}
+    for log_date, status_code, count in status_counts_by_date(request):
+        date_count_dict[log_date] += count
+        if status_code // 100 in class_counts:
+            class_counts[status_code // 100][log_date] += count
+
+    series = {f'errors{status_class}': [class_counts[status_class][day] for day in days]
+              for status_class in range(1, 6)}
+    series['date_labels'] = [day.strftime("%Y-%m-%d") for day in days]
+    # Build the month_stats list using our in-memory dictionary
+    series['month_stats'] = [date_count_dict[day] for day in days]
+    return series
 
 def index_panel(request):
     """
     Основной обработчик дашборда. Формирует статистику логов и передаёт данные в шаблон.
     """
-    print("Creating day stats")
-
-    start_date_str = request.GET.get('start_date', None)
-    end_date_str = request.GET.get('end_date', None)
-    filtered_objects = filter_logs(request)
-    errors1 = []
-    errors2 = []
-    errors3 = []
-    errors4 = []
-    errors5 = []
-    date_labels = []
-    if filtered_objects != None:
-        start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-        end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-        errors1 = [ FactLog.objects.filter(Q(datetime_entry__day=day.day) & Q(datetime_entry__month=day.month) & Q(datetime_entry__year=day.year) & Q(status_code__range=[100, 199])).count() for day in daterange(start_date, end_date) ]
-        errors2 = [ FactLog.objects.filter(Q(datetime_entry__day=day.day) & Q(datetime_entry__month=day.month) & Q(datetime_entry__year=day.year) & Q(status_code__range=[200, 299])).count() for day in daterange(start_date, end_date) ]
-        errors3 = [ FactLog.objects.filter(Q(datetime_entry__day=day.day) & Q(datetime_entry__month=day.month) & Q(datetime_entry__year=day.year) & Q(status_code__range=[300, 399])).count() for day in daterange(start_date, end_date) ]
-        errors4 = [ FactLog.objects.filter(Q(datetime_entry__day=day.day) & Q(datetime_entry__month=day.month) & Q(datetime_entry__year=day.year) & Q(status_code__range=[400, 499])).count() for day in daterange(start_date, end_date) ]
-        errors5 = [ FactLog.objects.filter(Q(datetime_entry__day=day.day) & Q(datetime_entry__month=day.month) & Q(datetime_entry__year=day.year) & Q(status_code__range=[500, 599])).count() for day in daterange(start_date, end_date) ]
-        date_labels = [day.strftime("%Y-%m-%d") for day in daterange(start_date, end_date)]
-
-        # Get all date counts in a single query
-        date_counts = (
-            filtered_objects
-            .values('datetime_entry__log_date')
-            .annotate(count=Count('id'))
-        )
-
-        # Create a dictionary mapping dates to counts
-        date_count_dict = defaultdict(int)
-        for item in date_counts:
-            date_count_dict[item['datetime_entry__log_date']] = item['count']
-
-        # Build the month_stats list using our in-memory dictionary
-        month_stats = [
-            date_count_dict[single_date]
-            for single_date in daterange(start_date, end_date)
-        ]
+    filters = get_log_filters(request)
+    if filters is not None:
+        # Одинаковые наборы фильтров в пределах поколения загрузки считаются один раз
+        series = cached_result('panel', filters, lambda: panel_series(request, filters))
     else:
-        month_stats = []
-
-    print("Counting requests")
-    total_requests = FactLog.objects.count()
-
-    print("Counting errors")
-    total_errors = total_requests - FactLog.objects.filter(status_code__range=[200, 299]).count()
-    print("Counting unique users")
-    total_unique_users = 0  # Здесь можно реализовать подсчёт уникальных пользователей
+        series = {f'errors{status_class}': [] for status_class in range(1, 6)}
+        series.update(date_labels=[], month_stats=[])
+    month_stats = series['month_stats']
+
+    # Итоги ServerStatusTotal, закэшированные под номером поколения загрузки, - без подсчёта строк FactLog
+    headline = headline_counters()
+    total_requests = headline["total_requests"]
+    total_errors = headline["total_errors"]
+    # Оценка по HyperLogLog-скетчам DailyUniqueSketch (ошибка ~1%) вместо COUNT(DISTINCT ip) по FactLog -
+    # за выбранный в панели период, без дат - за всё время
+    period = {name: filters[name] for name in ('start_date', 'end_date')} if filters is not None else {}
+    total_unique_users = cached_result('unique_users', period, lambda: unique_count(**period))
 
     # Получаем размер базы данных
     size_bytes = get_sqlite_db_size()
@@ -162,73 +206,208 @@ def index_panel(request):
         "total_requests": "{:,}".format(total_requests),
         "total_errors": "{:,}".format(total_errors),
         "total_unique_users": "{:,}".format(total_unique_users),
+        "requests_by_server": headline["by_server"],
+        "requests_by_status_class": headline["by_status_class"],
         "db_size": db_size,
     }
 
 
     context.update({
-        'errors1': errors1,
-        'errors2': errors2,
-        'errors3': errors3,
-        'errors4': errors4,
-        'errors5': errors5,
-        'date_labels' : date_labels,
+        'errors1': series['errors1'],
+        'errors2': series['errors2'],
+        'errors3': series['errors3'],
+        'errors4': series['errors4'],
+        'errors5': series['errors5'],
+        'date_labels' : series['date_labels'],
     })
 
     return render(request, 'dashboard/index_1.html', context)
 
+# Столбцы CSV-выгрузки (как поля FactLog) и значения, из которых они собираются:
+# внешние ключи разворачиваются в те же строки, что дают __str__ моделей измерений
+EXPORT_HEADER = ("id", "ip", "datetime_entry", "request", "user_agent_detail", "status_code", "bytes_sent",
+                 "referrer", "user_agent", "remote_user", "response_time", "server")
+EXPORT_VALUES = ("id", "ip__ip_address", "datetime_entry__log_date", "datetime_entry__log_time",
+                 "datetime_entry__utc_offset", "request__method", "request__path",
+                 "user_agent_detail__original_user_agent", "status_code", "bytes_sent", "referrer",
+                 "user_agent", "remote_user", "response_time", "server")
+
+def export_records(queryset, chunk_size=5000):
+    """
+    Строки выгрузки FactLog в порядке EXPORT_HEADER: одна выборка с JOIN
+    измерений, читаемая курсором порциями по chunk_size строк, - память не
+    зависит от размера выгрузки.
+    """
+    rows = queryset.values_list(*EXPORT_VALUES).iterator(chunk_size=chunk_size)
+    for pk, ip, log_date, log_time, utc_offset, method, path, user_agent_detail, *facts in rows:
+        yield (pk, ip, f"{log_date} {log_time} ({utc_offset})", f"{method} {path}", user_agent_detail, *facts)
+
+def export_csv_chunks(records, chunk_size=5000):
+    """Части CSV-выгрузки: заголовок и строки records, по chunk_size строк в части."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADER)
+    for i, record in enumerate(records, 1):
+        writer.writerow(record)
+        if i % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_ndjson_chunks(records, chunk_size=5000):
+    """Части NDJSON-выгрузки: по объекту с ключами EXPORT_HEADER на строку."""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(dict(zip(EXPORT_HEADER, record)), ensure_ascii=False))
+        if len(lines) == chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def gzip_chunks(chunks):
+    """Сжимает поток текстовых частей в gzip по мере их появления (wbits=31 - формат gzip)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Форматы выгрузки: функция кодирования, тип содержимого, расширение файла
+EXPORT_FORMATS = {
+    'csv': (export_csv_chunks, 'text/csv', 'csv'),
+    'ndjson': (export_ndjson_chunks, 'application/x-ndjson', 'ndjson'),
+}
+
 def request_export(request):
-    print("Exporting data...")
+    """
+    Выгрузка отфильтрованных записей потоком: ?format=csv (по умолчанию) или
+    ndjson, ?compress=gzip - сжатие на лету в файл .gz.
+    """
+    export_format = request.GET.get('format', 'csv')
+    compress = request.GET.get('compress', '')
+    if export_format not in EXPORT_FORMATS or compress not in ('', 'gzip'):
+        return HttpResponse("Error: unsupported export format", status=400)
     filtered_objects = filter_logs(request)
     if filtered_objects == None:
         return HttpResponse("Error: failed to apply filters")
-    opts = filtered_objects.model._meta
-    model = filtered_objects.model
-    response = HttpResponse(content_type='text/csv')
+
+    encode, content_type, extension = EXPORT_FORMATS[export_format]
+    chunks = encode(export_records(filtered_objects))
+    filename = f"export.{extension}"
+    if compress == 'gzip':
+        chunks = gzip_chunks(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
     # force download.
-    response['Content-Disposition'] = 'attachment;filename=export.csv'
-    # the csv writer
-    writer = csv.writer(response)
-
-    print("Preparing CSV")
-    field_names = [field.name for field in opts.fields]
-
-    # Write a first row with header information
-    writer.writerow(field_names)
-    # Write data rows
-    i = 0
-    size = len(filtered_objects)
-    if size > 100000:
-        return HttpResponse("Error: too many records")
-    for obj in filtered_objects:
-        if i % 1000 == 0:
-            print(f"Writing data {i}/{size}")
-        writer.writerow([getattr(obj, field) for field in field_names])
-        i += 1
+    response['Content-Disposition'] = f'attachment;filename={filename}'
     return response
 
+# Размер страницы обозревателя записей (log_page)
+EXPLORER_PAGE_SIZE = 50
+EXPLORER_MAX_PAGE_SIZE = 500
+
+def parse_cursor(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+def log_page(request):
+    """
+    Страница записей FactLog с фильтрами панели (filter_logs) при keyset-пагинации:
+    ?after=<id> - записи с id больше курсора, ?before=<id> - предыдущая страница,
+    ?limit= - размер страницы. Вместо OFFSET - условие по первичному ключу, поэтому
+    страница 10 000 стоит столько же, сколько первая; измерения подтягиваются
+    тем же запросом (select_related). Возвращает {'rows', 'previous', 'next'}
+    (курсоры соседних страниц или None) или None, если не задан диапазон дат.
+    """
+    facts = filter_logs(request)
+    if facts is None:
+        return None
+    facts = facts.select_related('ip', 'datetime_entry', 'request', 'user_agent_detail')
+    limit = parse_cursor(request.GET.get('limit')) or EXPLORER_PAGE_SIZE
+    limit = max(1, min(limit, EXPLORER_MAX_PAGE_SIZE))
+
+    before = parse_cursor(request.GET.get('before'))
+    if before is not None:
+        rows = list(facts.filter(id__lt=before).order_by('-id')[:limit + 1])
+        has_previous = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return {
+            'rows': rows,
+            'previous': rows[0].id if has_previous else None,
+            'next': rows[-1].id if rows else None,
+        }
+
+    after = parse_cursor(request.GET.get('after'))
+    rows = list(facts.filter(id__gt=after or 0).order_by('id')[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'rows': rows,
+        'previous': rows[0].id if after and rows else None,
+        'next': rows[-1].id if has_next else None,
+    }
+
+def log_record(fact):
+    """Запись FactLog в виде словаря с ключами EXPORT_HEADER (измерения - строками)."""
+    return {
+        "id": fact.id,
+        "ip": str(fact.ip),
+        "datetime_entry": str(fact.datetime_entry),
+        "request": str(fact.request),
+        "user_agent_detail": str(fact.user_agent_detail) if fact.user_agent_detail else None,
+        "status_code": fact.status_code,
+        "bytes_sent": fact.bytes_sent,
+        "referrer": fact.referrer,
+        "user_agent": fact.user_agent,
+        "remote_user": fact.remote_user,
+        "response_time": fact.response_time,
+        "server": fact.server,
+    }
+
+def log_explorer(request):
+    """Просмотр отдельных записей лога, подходящих под фильтры панели, постранично."""
+    page = log_page(request)
+    # Параметры фильтров без курсоров - к ним добавляются after/before в ссылках на соседние страницы
+    query = request.GET.copy()
+    for name in ('after', 'before'):
+        query.pop(name, None)
+    return render(request, 'dashboard/log_explorer.html', {
+        'page': page,
+        'records': [log_record(fact) for fact in page['rows']] if page else [],
+        'query': query.urlencode(),
+        'start_date': request.GET.get('start_date', ''),
+        'end_date': request.GET.get('end_date', ''),
+    })
+
 def index_upload_log(request):
     """
-    Обработчик для загрузки лог-файлов. При POST-запросе загруженный файл сохраняется во временное хранилище,
-    после чего вызывается функция обработки логов process_log_file.
+    Обработчик для загрузки лог-файлов. При POST-запросе загруженный файл ставится в очередь
+    фоновой обработки без лишнего копирования (см. dashboard.jobs.submit_upload). Ответ 202
+    содержит адрес, по которому страница загрузки опрашивает прогресс задания.
     """
     if request.method == 'POST':
         form = LogUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            log_file = form.cleaned_data['log_file']
-            with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                for chunk in log_file.chunks():
-                    tmp_file.write(chunk)
-                tmp_file_path = tmp_file.name
-            process_log_file(tmp_file_path)
-            return redirect(reverse('panel'))  # редирект на главную страницу дашборда
-             #   return render(request, 'upload_logs.html')
+            job = submit_upload(form.cleaned_data['log_file'])
+            return JsonResponse({"job_id": job.pk, "status_url": reverse('upload-log-status', args=[job.pk])},
+                                status=202)
         else:
             return HttpResponse(b"Error")
     else:
         form = LogUploadForm()
         return render(request, 'dashboard/index_upload_form.html', {'form': form})
 
+def upload_log_status(request, job_id):
+    """JSON с состоянием фонового задания загрузки: строки, скорость, статус."""
+    job = get_object_or_404(UploadJob, pk=job_id)
+    return JsonResponse(job_status(job))
+
 class DashboardView(TemplateView):
     """Главная страница дашборда с основными графиками и статистикой."""
     template_name = 'dashboard/index_1.html'
@@ -255,12 +434,24 @@ class DashboardView(TemplateView):
         if chart_form.is_valid():
             chart_config = chart_form.cleaned_data
 
-        # Получение данных для графика через модуль аналитики
-        time_series_data = LogAnalytics.get_request_over_time(
-            filters=filters,
-            time_aggregation=chart_config.get('time_aggregation', 'day'),
-            metric=chart_config.get('metric', 'count')
-        )
+        time_aggregation = chart_config.get('time_aggregation', 'day')
+        metric = chart_config.get('metric', 'count')
+        # Данные зависят только от фильтров, группировки и метрики (тип графика - нет)
+        data = cached_result('dashboard', dict(filters, time_aggregation=time_aggregation, metric=metric), lambda: {
+            # Получение данных для графика через модуль аналитики
+            'time_series': LogAnalytics.get_request_over_time(
+                filters=filters,
+                time_aggregation=time_aggregation,
+                metric=metric
+            ),
+            # Получение статистики распределения кодов состояния
+            'status': LogAnalytics.get_status_code_distribution(filters),
+            # Получение топ эндпоинтов и статистики по IP
+            'top_endpoints': LogAnalytics.get_top_endpoints(filters, limit=10),
+            'ip_stats': LogAnalytics.get_ip_stats(filters, limit=10),
+            'summary_stats': LogAnalytics.get_summary_stats(filters),
+        })
+        time_series_data = data['time_series']
 
         chart_type = chart_config.get('chart_type', 'line')
 
@@ -271,7 +462,6 @@ class DashboardView(TemplateView):
             'error_rate': ('Частота ошибок', 'Ошибки (%)'),
             'bandwidth': ('Использованная пропускная способность', 'Размер (байты)')
         }
-        metric = chart_config.get('metric', 'count')
         title, y_axis_label = metric_labels.get(metric, ('', ''))
 
         chart_config_json = ChartVisualizer.to_json(
@@ -283,8 +473,7 @@ class DashboardView(TemplateView):
             )
         )
 
-        # Получение статистики распределения кодов состояния
-        status_data = LogAnalytics.get_status_code_distribution(filters)
+        status_data = data['status']
         status_chart_json = ChartVisualizer.to_json(
             ChartVisualizer.get_pie_chart_config(
                 status_data,
@@ -292,19 +481,14 @@ class DashboardView(TemplateView):
             )
         )
 
-        # Получение топ эндпоинтов и статистики по IP
-        top_endpoints = LogAnalytics.get_top_endpoints(filters, limit=10)
-        ip_stats = LogAnalytics.get_ip_stats(filters, limit=10)
-        summary_stats = LogAnalytics.get_summary_stats(filters)
-
         context.update({
             'filter_form': filter_form,
             'chart_form': chart_form,
             'chart_config': chart_config_json,
             'status_chart_config': status_chart_json,
-            'top_endpoints': top_endpoints,
-            'ip_stats': ip_stats,
-            'summary_stats': summary_stats,
+            'top_endpoints': data['top_endpoints'],
+            'ip_stats': data['ip_stats'],
+            'summary_stats': data['summary_stats'],
         })
 
         return context
@@ -328,11 +512,11 @@ class DailyStatsView(TemplateView):
                     filters[key] = value
 
         # Данные для графика запросов по дням
-        daily_data = LogAnalytics.get_request_over_time(
+        daily_data = cached_result('daily_count', filters, lambda: LogAnalytics.get_request_over_time(
             filters=filters,
             time_aggregation='day',
             metric='count'
-        )
+        ))
 
         daily_chart_json = ChartVisualizer.to_json(
             ChartVisualizer.get_bar_chart_config(
@@ -343,11 +527,11 @@ class DailyStatsView(TemplateView):
         )
 
         # Данные по среднему времени ответа по дням
-        response_time_data = LogAnalytics.get_request_over_time(
+        response_time_data = cached_result('daily_avg_time', filters, lambda: LogAnalytics.get_request_over_time(
             filters=filters,
             time_aggregation='day',
             metric='avg_time'
-        )
+        ))
 
         response_time_chart_json = ChartVisualizer.to_json(
             ChartVisualizer.get_line_chart_config(
@@ -386,11 +570,11 @@ class ErrorAnalysisView(TemplateView):
         # Фильтрация по 4xx и 5xx ошибкам
         error_filters = filters.copy()
         error_filters['status_code'] = '4xx'
-        error_4xx_data = LogAnalytics.get_request_over_time(
+        error_4xx_data = cached_result('daily_count', error_filters, lambda: LogAnalytics.get_request_over_time(
             filters=error_filters,
             time_aggregation='day',
             metric='count'
-        )
+        ))
         error_4xx_chart_json = ChartVisualizer.to_json(
             ChartVisualizer.get_line_chart_config(
                 error_4xx_data,
@@ -400,11 +584,11 @@ class ErrorAnalysisView(TemplateView):
         )
 
         error_filters['status_code'] = '5xx'
-        error_5xx_data = LogAnalytics.get_request_over_time(
+        error_5xx_data = cached_result('daily_count', error_filters, lambda: LogAnalytics.get_request_over_time(
             filters=error_filters,
             time_aggregation='day',
             metric='count'
-        )
+        ))
         error_5xx_chart_json = ChartVisualizer.to_json(
             ChartVisualizer.get_line_chart_config(
                 error_5xx_data,
@@ -456,25 +640,3 @@ class ExampleError(TemplateView):
         context['border_colors'] = border_colors
 
         return context
-
-
-#class ChartDataAPIView(View):
-#    """API для получения данных графиков."""
-#
-#    def get(self, request, *args, **kwargs):
-#        filter_form = LogFilterForm(request.GET or None)
-#        chart_form = ChartConfigForm(request.GET or None)
-#
-#        filters = {}
-#        if filter_form.is_valid():
-#            for key, value in filter_form.cleaned_data.items():
-#                if value:
-#                    filters[key] = value
-#
-#        chart_config = {}
-#        if chart_form.is_valid():
-#            chart_config = chart_form.cleaned_data
-#
-#        time_aggregation = chart_config.get('time_aggregation', 'day')
-#        metric = chart_config.get('metric', 'count')
-#        chart_type = chart_config.get('chart_type', 'line')
@@ -83,6 +83,21 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Результаты запросов дашборда (dashboard.result_cache) и итоги для шапки.
+# LocMemCache у каждого процесса свой; при нескольких процессах - Redis/Memcached.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -124,3 +139,20 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Вычисляемые ключи DimDateTime (YYYYMMDDHHMMSS + код смещения) вместо
+# суррогатных id. Перед включением на существующей БД выполните
+# python manage.py migrate_datetime_keys
+LOGPARSER_DATETIME_SMART_KEYS = False
+
+# Сколько потоков обрабатывают загруженные через дашборд лог-файлы
+# в фоне (dashboard.jobs). Для SQLite больше одного смысла нет.
+LOGPARSER_UPLOAD_WORKERS = 1
+
+# Обновлять дневные агрегаты (IpDateAggregate, DateStatusAggregate) прямо
+# при загрузке файлов через дашборд, без отдельного aggregate_logs.
+LOGPARSER_INLINE_AGGREGATES = False
+
+# Сколько секунд хранить в кэше результаты запросов дашборда. Загрузка
+# новых данных сбрасывает их раньше: ключ включает номер поколения загрузки.
+LOGPARSER_RESULT_CACHE_TIMEOUT = 600
@@ -0,0 +1,461 @@
+"""
+Инкрементальный пересчёт агрегатов FactLog: группируются только записи
+с id больше сохранённой отметки (AggregateWatermark), а их меры прибавляются
+к уже существующим строкам агрегатов (INSERT ... ON CONFLICT DO UPDATE).
+"""
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce
+
+from logparser.models import (
+    AggregateWatermark, DailyTopValues, DailyUniqueSketch, DateStatusAggregate, FactLog, HourlyRollup,
+    IngestGeneration, IpDateAggregate, RequestLatencySketch, ServerStatusTotal,
+)
+from logparser.sketches import LatencySketch, TopKSketch, UniqueSketch
+
+HEADLINE_WATERMARK = 'headline'
+DAILY_WATERMARK = 'daily'
+HOURLY_WATERMARK = 'hourly'
+LATENCY_WATERMARK = 'latency'
+UNIQUE_WATERMARK = 'unique'
+TOP_WATERMARK = 'top'
+
+
+class AggregateSpec:
+    """
+    Описание агрегата: модель, поля её уникального ключа, соответствующие им
+    выражения группировки FactLog и меры - (поле модели, агрегатная функция
+    по FactLog, способ слияния со строкой агрегата: 'sum', 'min' или 'max').
+    """
+
+    def __init__(self, model, key_fields, group_by, measures):
+        self.model = model
+        self.key_fields = key_fields
+        # Имена полей FactLog превращаются в F(): values() принимает выражения только по ключевым словам
+        self.group_by = [F(expression) if isinstance(expression, str) else expression for expression in group_by]
+        self.measures = measures
+
+    def merges(self):
+        return [(field, merge) for field, _, merge in self.measures]
+
+    def count_facts(self, facts):
+        """Группирует выборку FactLog и прибавляет её меры к строкам агрегата."""
+        group = {f"key_{i}": expression for i, expression in enumerate(self.group_by)}
+        measures = {f"measure_{field}": expression for field, expression, _ in self.measures}
+        rows = [
+            tuple(rec[name] for name in group) + tuple(rec[name] for name in measures)
+            for rec in facts.values(**group).annotate(**measures).order_by()
+        ]
+        upsert_rows(self.model, self.key_fields, self.merges(), rows)
+        return len(rows)
+
+
+COUNT = (('count', Count('id'), 'sum'),)
+
+IP_DATE = AggregateSpec(IpDateAggregate, ('ip_id', 'log_date'), ('ip_id', 'datetime_entry__log_date'), COUNT)
+DATE_STATUS = AggregateSpec(DateStatusAggregate, ('log_date', 'status_code'),
+                            ('datetime_entry__log_date', 'status_code'), COUNT)
+SERVER_STATUS = AggregateSpec(ServerStatusTotal, ('server', 'status_class'),
+                              ('server', F('status_code') / 100), COUNT)
+HOURLY_ROLLUP = AggregateSpec(
+    HourlyRollup,
+    ('log_date', 'hour', 'server', 'method', 'status_code', 'browser_family', 'os_family'),
+    ('datetime_entry__log_date', 'datetime_entry__hour', 'server', 'request__method', 'status_code',
+     # Без разбора user-agent браузер и ОС неизвестны: NULL в уникальном ключе не совпадает сам с собой
+     Coalesce('user_agent_detail__browser_family', Value('')),
+     Coalesce('user_agent_detail__os_family', Value(''))),
+    COUNT + (
+        ('bytes_sum', Sum('bytes_sent'), 'sum'),
+        ('bytes_max', Max('bytes_sent'), 'max'),
+        ('response_time_sum', Sum('response_time'), 'sum'),
+        ('response_time_min', Min('response_time'), 'min'),
+        ('response_time_max', Max('response_time'), 'max'),
+    ),
+)
+
+
+class SketchSpec:
+    """
+    Агрегат из скетчей (logparser.sketches): строка модели хранит по ключу
+    key_fields сериализованный скетч и его оценку count. В отличие от
+    AggregateSpec строки сливаются не в SQL, а объединением скетчей в Python.
+    Подклассы задают, какие пары (ключ, значение) даёт выборка FactLog.
+    """
+    model = None
+    sketch_class = None
+    key_fields = ()
+    # Сколько значений группируется в памяти за раз при пересчёте
+    batch_size = 200000
+
+    def fact_values(self, facts):
+        """Пары (ключ, значение) для записей выборки FactLog."""
+        raise NotImplementedError
+
+    def count_facts(self, facts):
+        sketches = {}
+        grouped = defaultdict(list)
+        pending = 0
+        for key, value in self.fact_values(facts):
+            grouped[key].append(value)
+            pending += 1
+            if pending >= self.batch_size:
+                self.add_to_sketches(sketches, grouped)
+                grouped.clear()
+                pending = 0
+        self.add_to_sketches(sketches, grouped)
+        self.merge_sketches(sketches)
+        return len(sketches)
+
+    def add_values(self, pairs):
+        """Для ведения при загрузке: прибавляет к скетчам пары (ключ, значение) порции."""
+        grouped = defaultdict(list)
+        for key, value in pairs:
+            grouped[key].append(value)
+        sketches = {}
+        self.add_to_sketches(sketches, grouped)
+        self.merge_sketches(sketches)
+
+    def add_to_sketches(self, sketches, grouped):
+        """Добавляет значения grouped {ключ: [значения]} в скетчи sketches {ключ: скетч}."""
+        for key, values in grouped.items():
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = self.sketch_class()
+            sketch.add_many(values)
+
+    def merge_sketches(self, sketches, batch_size=500):
+        """Объединяет скетчи {ключ: скетч} с сохранёнными в модели; строки с новым ключом создаются."""
+        keys = list(sketches)
+        for i in range(0, len(keys), batch_size):
+            chunk = keys[i:i + batch_size]
+            existing = self.model.objects.filter(**{
+                f"{field}__in": {key[n] for key in chunk} for n, field in enumerate(self.key_fields)
+            })
+            stored = {tuple(getattr(row, field) for field in self.key_fields): row for row in existing}
+            to_create = []
+            to_update = []
+            for key in chunk:
+                sketch = sketches[key]
+                row = stored.get(key)
+                if row is None:
+                    to_create.append(self.model(**dict(zip(self.key_fields, key)),
+                                                count=sketch.count, sketch=sketch.to_bytes()))
+                else:
+                    merged = self.sketch_class.from_bytes(row.sketch).merge(sketch)
+                    row.count = merged.count
+                    row.sketch = merged.to_bytes()
+                    to_update.append(row)
+            self.model.objects.bulk_create(to_create, batch_size=batch_size)
+            self.model.objects.bulk_update(to_update, ['count', 'sketch'], batch_size=batch_size)
+
+
+class LatencySketchSpec(SketchSpec):
+    """Скетчи квантилей времени ответа по (день, DimRequest)."""
+    model = RequestLatencySketch
+    sketch_class = LatencySketch
+    key_fields = ('log_date', 'request_id')
+
+    def fact_values(self, facts):
+        rows = (facts.values_list('datetime_entry__log_date', 'request_id', 'response_time')
+                .order_by().iterator(chunk_size=self.batch_size))
+        for log_date, request_id, response_time in rows:
+            yield (log_date, request_id), response_time
+
+
+class UniqueSketchSpec(SketchSpec):
+    """HyperLogLog уникальных IP и пар IP + user-agent по (день, сервер)."""
+    model = DailyUniqueSketch
+    sketch_class = UniqueSketch
+    key_fields = ('log_date', 'server', 'kind')
+
+    def fact_values(self, facts):
+        rows = (facts.values_list('datetime_entry__log_date', 'server', 'ip__ip_address', 'user_agent')
+                .order_by().iterator(chunk_size=self.batch_size))
+        for log_date, server, ip, user_agent in rows:
+            yield from unique_values(log_date, server, ip, user_agent)
+
+
+def unique_values(log_date, server, ip, user_agent):
+    """Пары (ключ DailyUniqueSketch, значение) для одной записи лога."""
+    return (
+        ((log_date, server, DailyUniqueSketch.IP), ip),
+        ((log_date, server, DailyUniqueSketch.IP_USER_AGENT), f"{ip} {user_agent}"),
+    )
+
+
+class TopValuesSpec(SketchSpec):
+    """Сводки самых частых эндпоинтов, IP и user-agent по дням."""
+    model = DailyTopValues
+    sketch_class = TopKSketch
+    key_fields = ('log_date', 'dimension')
+
+    def fact_values(self, facts):
+        rows = (facts.values_list('datetime_entry__log_date', 'request_id', 'ip_id', 'user_agent')
+                .order_by().iterator(chunk_size=self.batch_size))
+        for log_date, request_id, ip_id, user_agent in rows:
+            yield from top_values(log_date, request_id, ip_id, user_agent)
+
+
+def top_values(log_date, request_id, ip_id, user_agent):
+    """Пары (ключ DailyTopValues, значение) для одной записи лога."""
+    return (
+        ((log_date, DailyTopValues.ENDPOINT), request_id),
+        ((log_date, DailyTopValues.IP), ip_id),
+        ((log_date, DailyTopValues.USER_AGENT), user_agent),
+    )
+
+
+# Поле FactLog, по которому пересчитываются кандидаты каждого измерения DailyTopValues
+TOP_FACT_FIELDS = {
+    DailyTopValues.ENDPOINT: 'request_id',
+    DailyTopValues.IP: 'ip_id',
+    DailyTopValues.USER_AGENT: 'user_agent',
+}
+
+LATENCY_SKETCHES = LatencySketchSpec()
+UNIQUE_SKETCHES = UniqueSketchSpec()
+TOP_VALUES = TopValuesSpec()
+
+# Агрегаты, которые ведутся по одной отметке и пересчитываются вместе
+AGGREGATES = {
+    HEADLINE_WATERMARK: (SERVER_STATUS,),
+    DAILY_WATERMARK: (IP_DATE, DATE_STATUS),
+    HOURLY_WATERMARK: (HOURLY_ROLLUP,),
+    LATENCY_WATERMARK: (LATENCY_SKETCHES,),
+    UNIQUE_WATERMARK: (UNIQUE_SKETCHES,),
+    TOP_WATERMARK: (TOP_VALUES,),
+}
+
+
+def merge_sql(merge, current, new):
+    """SQL слияния меры строки агрегата (current) с новым значением (new); NULL не затирает значение."""
+    if merge == 'sum':
+        return f"COALESCE({current}, 0) + COALESCE({new}, 0)"
+    # MAX/MIN с несколькими аргументами в SQLite - скалярные функции (в PostgreSQL - GREATEST/LEAST)
+    func = {'max': 'MAX', 'min': 'MIN'}[merge]
+    if connection.vendor != 'sqlite':
+        func = {'max': 'GREATEST', 'min': 'LEAST'}[merge]
+    return f"{func}(COALESCE({current}, {new}), COALESCE({new}, {current}))"
+
+
+def upsert_rows(model, key_fields, merges, rows):
+    """
+    Сливает строки rows - кортежи (значения key_fields..., значения мер...) -
+    со строками агрегата model: меры merges [(поле, 'sum'|'min'|'max')]
+    объединяются с уже существующими, строки с новым ключом создаются.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    keys = ", ".join(qn(model._meta.get_field(name).column) for name in key_fields)
+    columns = [qn(model._meta.get_field(field).column) for field, _ in merges]
+    updates = ", ".join(
+        f"{column} = {merge_sql(merge, f'{table}.{column}', f'excluded.{column}')}"
+        for column, (_, merge) in zip(columns, merges)
+    )
+    placeholders = ", ".join(["%s"] * (len(key_fields) + len(merges)))
+    sql = (f"INSERT INTO {table} ({keys}, {', '.join(columns)}) VALUES ({placeholders}) "
+           f"ON CONFLICT ({keys}) DO UPDATE SET {updates}")
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+@transaction.atomic
+def update_aggregates(name, full=False):
+    """
+    Дополняет агрегаты AGGREGATES[name] записями FactLog, появившимися после
+    отметки name; full=True пересчитывает их с нуля. Если максимальный id
+    FactLog меньше отметки (таблица очищалась), агрегаты тоже пересчитываются с нуля.
+    Возвращает (id после которого начат пересчёт, новая отметка, {модель: затронуто строк}).
+    """
+    watermark, _ = AggregateWatermark.objects.select_for_update().get_or_create(name=name)
+    last_id = FactLog.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    if last_id < watermark.last_fact_id:
+        full = True
+    start_id = 0 if full else watermark.last_fact_id
+    if full:
+        for spec in AGGREGATES[name]:
+            spec.model.objects.all().delete()
+    touched = {}
+    if last_id > start_id:
+        facts = FactLog.objects.filter(id__gt=start_id, id__lte=last_id)
+        for spec in AGGREGATES[name]:
+            touched[spec.model] = spec.count_facts(facts)
+    watermark.last_fact_id = last_id
+    watermark.save(update_fields=['last_fact_id', 'updated_at'])
+    return start_id, last_id, touched
+
+
+def aggregates_are_current(name):
+    """Учтены ли в агрегатах name все записи FactLog."""
+    last_id = FactLog.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    return AggregateWatermark.objects.filter(name=name, last_fact_id=last_id).exists()
+
+
+def lock_watermarks(names=None):
+    """
+    Для ведения агрегатов при загрузке (store_batch): догоняет агрегаты names
+    (по умолчанию все), если они отстают от FactLog, и блокирует их отметки
+    до конца текущей транзакции. После этого каждая отметка равна
+    максимальному id FactLog.
+    """
+    names = list(AGGREGATES) if names is None else list(names)
+    for name in names:
+        update_aggregates(name)
+    return list(AggregateWatermark.objects.select_for_update().filter(name__in=names))
+
+
+def advance_watermarks(watermarks):
+    """Сдвигает отметки на максимальный id FactLog после вставки уже учтённой порции."""
+    last_id = FactLog.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+    for watermark in watermarks:
+        watermark.last_fact_id = last_id
+        watermark.save(update_fields=['last_fact_id', 'updated_at'])
+
+
+def add_headline_counts(server, status_codes):
+    """Прибавляет к ServerStatusTotal счётчики порции одного сервера (столбец status_code)."""
+    upsert_rows(ServerStatusTotal, SERVER_STATUS.key_fields, SERVER_STATUS.merges(),
+                [(server, status_class, cnt) for status_class, cnt
+                 in Counter(status_code // 100 for status_code in status_codes).items()])
+
+
+def bump_generation():
+    """Увеличивает номер поколения загруженных данных (после загрузки файла или порции слежения)."""
+    if not IngestGeneration.objects.filter(pk=1).update(generation=F('generation') + 1):
+        IngestGeneration.objects.create(pk=1, generation=1)
+
+
+def current_generation():
+    return IngestGeneration.objects.filter(pk=1).values_list('generation', flat=True).first() or 0
+
+
+def headline_counters():
+    """
+    Итоги для шапки дашборда: всего запросов, ошибок (всё, кроме 2xx), запросов
+    по серверам и по классам статусов. Считаются по ServerStatusTotal, без
+    подсчёта строк FactLog, и кэшируются под номером поколения загрузки.
+    """
+    cache_key = f"logparser:headline:{current_generation()}"
+    counters = cache.get(cache_key)
+    if counters is not None:
+        return counters
+    if not aggregates_are_current(HEADLINE_WATERMARK):
+        update_aggregates(HEADLINE_WATERMARK)
+    by_server = Counter()
+    by_status_class = Counter()
+    for server, status_class, count in ServerStatusTotal.objects.values_list('server', 'status_class', 'count'):
+        by_server[server] += count
+        by_status_class[f"{status_class}xx"] += count
+    total_requests = sum(by_server.values())
+    counters = {
+        "total_requests": total_requests,
+        "total_errors": total_requests - by_status_class["2xx"],
+        "by_server": dict(by_server),
+        "by_status_class": dict(sorted(by_status_class.items())),
+    }
+    cache.set(cache_key, counters)
+    return counters
+
+
+def add_daily_counts(ip_ids, dates, status_codes):
+    """Прибавляет к дневным агрегатам счётчики порции (столбцы ip_id, дата, status_code)."""
+    upsert_rows(IpDateAggregate, IP_DATE.key_fields, IP_DATE.merges(),
+                [key + (cnt,) for key, cnt in Counter(zip(ip_ids, dates)).items()])
+    upsert_rows(DateStatusAggregate, DATE_STATUS.key_fields, DATE_STATUS.merges(),
+                [key + (cnt,) for key, cnt in Counter(zip(dates, status_codes)).items()])
+
+
+def add_hourly_rollup(keys, bytes_sent, response_times):
+    """
+    Прибавляет к HourlyRollup меры порции: keys - столбец ключей куба
+    (дата, час, сервер, метод, status_code, браузер, ОС), bytes_sent и
+    response_times - соответствующие столбцы значений.
+    """
+    cells = {}
+    for key, size, response_time in zip(keys, bytes_sent, response_times):
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = [1, size, size, response_time, response_time, response_time]
+        else:
+            cell[0] += 1
+            cell[1] += size
+            if size > cell[2]:
+                cell[2] = size
+            if response_time is not None:
+                cell[3] = response_time if cell[3] is None else cell[3] + response_time
+                cell[4] = response_time if cell[4] is None else min(cell[4], response_time)
+                cell[5] = response_time if cell[5] is None else max(cell[5], response_time)
+    upsert_rows(HourlyRollup, HOURLY_ROLLUP.key_fields, HOURLY_ROLLUP.merges(),
+                [key + tuple(cell) for key, cell in cells.items()])
+
+
+def latency_percentiles(start_date, end_date, quantiles=(0.5, 0.95, 0.99), request_ids=None):
+    """
+    Квантили времени ответа по эндпоинтам за период: объединяет дневные скетчи.
+    Возвращает {request_id: (количество, [значения квантилей])}.
+    """
+    rows = RequestLatencySketch.objects.filter(log_date__range=(start_date, end_date))
+    if request_ids is not None:
+        rows = rows.filter(request_id__in=request_ids)
+    merged = {}
+    for request_id, data in rows.values_list('request_id', 'sketch').iterator():
+        sketch = LatencySketch.from_bytes(data)
+        if request_id in merged:
+            merged[request_id].merge(sketch)
+        else:
+            merged[request_id] = sketch
+    return {
+        request_id: (sketch.count, [sketch.quantile(q) for q in quantiles])
+        for request_id, sketch in merged.items()
+    }
+
+
+def unique_count(kind=DailyUniqueSketch.IP, start_date=None, end_date=None, servers=None):
+    """
+    Оценка числа уникальных IP (или пар IP + user-agent) за период и по
+    серверам: объединяет скетчи DailyUniqueSketch. Без дат - за всё время.
+    Если скетчи отстают от FactLog, они сначала дополняются.
+    """
+    if not aggregates_are_current(UNIQUE_WATERMARK):
+        update_aggregates(UNIQUE_WATERMARK)
+    rows = DailyUniqueSketch.objects.filter(kind=kind)
+    if start_date is not None and end_date is not None:
+        rows = rows.filter(log_date__range=(start_date, end_date))
+    if servers is not None:
+        rows = rows.filter(server__in=servers)
+    merged = UniqueSketch()
+    for data in rows.values_list('sketch', flat=True).iterator():
+        merged.merge(UniqueSketch.from_bytes(data))
+    return merged.count
+
+
+def top_values_over_range(dimension, limit, start_date=None, end_date=None, **annotations):
+    """
+    limit самых частых значений измерения DailyTopValues за период (без дат -
+    за всё время). Дневные сводки объединяются, а кандидаты из объединённой
+    сводки пересчитываются по FactLog точно - одним GROUP BY только по ним.
+    Возвращает словари {'value', 'count', **annotations} по убыванию count.
+    """
+    summaries = DailyTopValues.objects.filter(dimension=dimension)
+    facts = FactLog.objects.all()
+    if start_date is not None:
+        summaries = summaries.filter(log_date__gte=start_date)
+        facts = facts.filter(datetime_entry__log_date__gte=start_date)
+    if end_date is not None:
+        summaries = summaries.filter(log_date__lte=end_date)
+        facts = facts.filter(datetime_entry__log_date__lte=end_date)
+    merged = TopKSketch()
+    for data in summaries.values_list('sketch', flat=True).iterator():
+        merged.merge(TopKSketch.from_bytes(data))
+    candidates = merged.top(limit)
+    if not candidates:
+        return []
+    field = TOP_FACT_FIELDS[dimension]
+    rows = (facts.filter(**{f"{field}__in": candidates})
+            .values(value=F(field)).annotate(count=Count('id'), **annotations).order_by('-count'))
+    return list(rows[:limit])
@@ -0,0 +1,99 @@
+"""
+Колоночный разбор порции строк лога: вместо словаря на каждую строку
+значения полей собираются в столбцы (списки строк, числовые поля - массивы NumPy).
+"""
+from itertools import compress
+
+import numpy as np
+
+# Группы регулярного выражения строки лога, из которых строятся столбцы
+PATTERN_GROUPS = (
+    "client_ip", "user_id", "datetime", "method", "api", "protocol",
+    "status_code", "bytes", "referrer", "user_agent", "response_time",
+)
+
+
+class LogBatch:
+    """
+    Распарсенная порция строк лога в виде столбцов одинаковой длины.
+    Временные метки хранятся исходными строками; разобранные поля DimDateTime
+    лежат в datetime_fields - по одному разу на каждую различную метку.
+    Также user_agent_details содержит разбор каждого различного user-agent
+    (None, если загрузчик user-agent не разбирает).
+    """
+
+    __slots__ = (
+        "ips", "remote_users", "timestamps", "methods", "paths", "http_versions",
+        "status_codes", "bytes_sent", "referrers", "user_agents", "response_times",
+        "datetime_fields", "user_agent_details",
+    )
+
+    def __init__(self, ips, remote_users, timestamps, methods, paths, http_versions,
+                 status_codes, bytes_sent, referrers, user_agents, response_times,
+                 datetime_fields, user_agent_details=None):
+        self.ips = ips
+        self.remote_users = remote_users
+        self.timestamps = timestamps
+        self.methods = methods
+        self.paths = paths
+        self.http_versions = http_versions
+        self.status_codes = status_codes
+        self.bytes_sent = bytes_sent
+        self.referrers = referrers
+        self.user_agents = user_agents
+        self.response_times = response_times
+        self.datetime_fields = datetime_fields
+        self.user_agent_details = user_agent_details
+
+    def __len__(self):
+        return len(self.ips)
+
+    def slice(self, start, stop):
+        """Часть порции со строками [start, stop); словари разборов общие с исходной."""
+        return LogBatch(
+            self.ips[start:stop], self.remote_users[start:stop], self.timestamps[start:stop],
+            self.methods[start:stop], self.paths[start:stop], self.http_versions[start:stop],
+            self.status_codes[start:stop], self.bytes_sent[start:stop], self.referrers[start:stop],
+            self.user_agents[start:stop], self.response_times[start:stop],
+            self.datetime_fields, self.user_agent_details,
+        )
+
+
+def parse_batch(lines, pattern, timestamp_parser, user_agent_details=None):
+    """
+    Разбирает порцию строк в LogBatch. Строки, не подходящие под pattern
+    или с некорректной временной меткой, пропускаются.
+    Временные метки разбираются timestamp_parser по одному разу на различную метку,
+    user-agent - функцией user_agent_details (если передана) по одному разу на различную строку.
+    """
+    matches = [m.groups() for m in map(pattern.match, lines) if m is not None]
+    # Транспонирование в столбцы и выбор нужных групп - без цикла по строкам на Python
+    all_columns = list(zip(*matches)) or [()] * pattern.groups
+    del matches
+    columns = [all_columns[pattern.groupindex[name] - 1] for name in PATTERN_GROUPS]
+
+    datetime_fields = {}
+    invalid = False
+    # dict.fromkeys сохраняет порядок меток - кэш TimestampParser опирается на соседние строки
+    for dt_str in dict.fromkeys(columns[2]):
+        try:
+            datetime_fields[dt_str] = timestamp_parser.parse_fields(dt_str)
+        except ValueError:
+            invalid = True
+    if invalid:
+        keep = [dt_str in datetime_fields for dt_str in columns[2]]
+        columns = [tuple(compress(column, keep)) for column in columns]
+
+    (ips, remote_users, timestamps, methods, paths, http_versions,
+     status_codes, bytes_sent, referrers, user_agents, response_times) = columns
+    ua_details = None
+    if user_agent_details is not None:
+        ua_details = {ua_string: user_agent_details(ua_string) for ua_string in dict.fromkeys(user_agents)}
+    return LogBatch(
+        ips, remote_users, timestamps, methods, paths, http_versions,
+        np.array(status_codes, dtype=np.int64),
+        np.array(bytes_sent, dtype=np.int64),
+        referrers, user_agents,
+        np.array(response_times, dtype=np.float64),
+        datetime_fields, ua_details,
+    )
@@ -0,0 +1,123 @@
+"""
+Чтение растущих лог-файлов (аналог tail -F) для потоковой загрузки.
+"""
+import os
+
+
+class FollowedFile:
+    """
+    Открытый лог-файл, из которого уже прочитано offset байт; line_offset -
+    смещение конца последней возвращённой полной строки. Чтение начинается
+    с offset (если задан), иначе с начала или с конца файла (start_at_end).
+    """
+
+    def __init__(self, path, start_at_end=False, offset=None):
+        self.path = path
+        self.file = open(path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.inode = (stat.st_dev, stat.st_ino)
+        if offset is None:
+            offset = stat.st_size if start_at_end else 0
+        self.offset = offset
+        self.line_offset = offset
+        self.file.seek(self.offset)
+        # Хвост без перевода строки: строка ещё дописывается
+        self.partial = b''
+
+    def read_lines(self, max_bytes):
+        """Возвращает новые полные строки (str), дочитанные с прошлого вызова."""
+        data = self.file.read(max_bytes)
+        if not data:
+            return []
+        self.offset += len(data)
+        data = self.partial + data
+        parts = data.split(b'\n')
+        self.partial = parts.pop()
+        self.line_offset = self.offset - len(self.partial)
+        return [part.decode('utf-8', errors='replace').rstrip('\r') for part in parts]
+
+    def read_partial(self):
+        """Возвращает недописанный хвост как последнюю строку (файл больше не растёт)."""
+        if not self.partial:
+            return []
+        line = self.partial.decode('utf-8', errors='replace').rstrip('\r')
+        self.partial = b''
+        self.line_offset = self.offset
+        return [line]
+
+    def close(self):
+        self.file.close()
+
+
+class LogFollower:
+    """
+    Следит за .log файлами каталога: дочитывает новые строки, подхватывает
+    новые файлы и замечает ротацию (сменился inode) или усечение (размер
+    стал меньше прочитанного) - в этих случаях файл читается с начала.
+    open_file(path, start_at_end) открывает FollowedFile - например, со
+    смещения из журнала загрузки; start_at_end передаётся только для файлов,
+    которые были в каталоге при запуске. Заменённый при ротации или усечении
+    FollowedFile закрывается только при следующем poll(), чтобы вызывающий
+    успел обработать его последние строки.
+    """
+
+    def __init__(self, logdir, suffix='.log', start_at_end=False, max_bytes=4 * 1024 * 1024, open_file=None):
+        self.logdir = logdir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.open_file = open_file or FollowedFile
+        self.files = {}
+        self.retired = []
+        for path in self._scan():
+            self.files[path] = self.open_file(path, start_at_end)
+
+    def _scan(self):
+        return sorted(os.path.join(self.logdir, f) for f in os.listdir(self.logdir) if f.endswith(self.suffix))
+
+    def poll(self):
+        """
+        Возвращает список (FollowedFile, [строки]) с новыми строками по всем файлам;
+        line_offset файла - смещение конца последней из этих строк.
+        """
+        self._close_retired()
+        result = []
+        for path in self._scan():
+            if path not in self.files:
+                self.files[path] = self.open_file(path, False)
+        for path, followed in list(self.files.items()):
+            lines = followed.read_lines(self.max_bytes)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat is None or (stat.st_dev, stat.st_ino) != followed.inode:
+                # Файл ротирован: дочитываем старый дескриптор до конца и переключаемся на новый
+                while True:
+                    rest = followed.read_lines(self.max_bytes)
+                    if not rest:
+                        break
+                    lines.extend(rest)
+                lines.extend(followed.read_partial())
+                self.retired.append(followed)
+                if stat is None:
+                    del self.files[path]
+                else:
+                    self.files[path] = self.open_file(path, False)
+            elif stat.st_size < followed.offset:
+                # Файл усечён (copytruncate) - читаем заново с начала
+                self.retired.append(followed)
+                self.files[path] = self.open_file(path, False)
+            if lines:
+                result.append((followed, lines))
+        return result
+
+    def _close_retired(self):
+        for followed in self.retired:
+            followed.close()
+        self.retired = []
+
+    def close(self):
+        self._close_retired()
+        for followed in self.files.values():
+            followed.close()
+        self.files = {}
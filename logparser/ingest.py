@@ -0,0 +1,556 @@
+"""
+Общая часть загрузчиков логов: разрешение измерений и запись FactLog.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+
+from logparser.aggregates import (
+    HEADLINE_WATERMARK, LATENCY_SKETCHES, TOP_VALUES, UNIQUE_SKETCHES, add_daily_counts, add_headline_counts,
+    add_hourly_rollup, advance_watermarks, bump_generation, lock_watermarks, top_values, unique_values,
+)
+from logparser.models import DimIP, DimDateTime, DimRequest, DimUserAgent, FactLog, IngestedFile
+from logparser.parse_utils import (
+    LRUCache, decompress_blocks, open_log_file, read_line_chunks, skip_bytes, split_line_blocks,
+)
+
+# Поля DimDateTime в том порядке, в котором они образуют ключ измерения
+DATETIME_KEY_FIELDS = ("log_date", "log_time", "utc_offset", "year", "month", "day", "hour", "minute", "second")
+REQUEST_KEY_FIELDS = ("method", "path", "http_version")
+USER_AGENT_FIELDS = (
+    "browser_family", "browser_version", "os_family", "os_version",
+    "device_family", "is_mobile", "is_tablet", "is_pc",
+)
+# Поля FactLog в порядке значений строки, которую строит store_batch
+FACT_COLUMNS = (
+    "ip_id", "datetime_entry_id", "request_id", "status_code", "bytes_sent", "referrer",
+    "user_agent", "user_agent_detail_id", "remote_user", "response_time", "server",
+)
+# Сколько байт с начала и с конца файла входит в его отпечаток
+FINGERPRINT_BLOCK = 64 * 1024
+# Префикс пути в журнале IngestedFile для логов, загруженных потоком (без файла)
+STREAM_LEDGER_PREFIX = "upload:"
+
+
+def server_for_file(filepath):
+    """
+    Определяет сервер по имени файла: если в имени есть "logfiles"
+    (регистр не важен), это Server B, иначе Server A.
+    """
+    return "Server B" if "logfiles" in os.path.basename(filepath).lower() else "Server A"
+
+
+class DimensionCache:
+    """
+    Кэш "ключ измерения -> id" для одной таблицы измерения, живущий всю сессию загрузки.
+
+    В БД запрашиваются только ключи, которых нет в кэше; новые записи создаются
+    через bulk_create, и их id попадают в кэш после фиксации транзакции
+    (при откате транзакции кэш не содержит несуществующих id).
+    Размер кэша ограничен maxsize, вытесняются давно не использованные ключи.
+    """
+
+    def __init__(self, model, key_fields, lookup_fields=None, maxsize=200000, batch_size=500):
+        self.model = model
+        self.key_fields = key_fields
+        # Поля, по которым строится фильтр field__in при запросе неизвестных ключей
+        self.lookup_fields = lookup_fields or key_fields
+        self.batch_size = batch_size
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def make_key(self, values):
+        """Ключ кэша из словаря/строки values: скаляр для одного поля, иначе кортеж."""
+        if len(self.key_fields) == 1:
+            return values[self.key_fields[0]]
+        return tuple(values[field] for field in self.key_fields)
+
+    def key_values(self, key):
+        if len(self.key_fields) == 1:
+            return {self.key_fields[0]: key}
+        return dict(zip(self.key_fields, key))
+
+    def resolve(self, keys):
+        """
+        Возвращает {ключ: id} для всех ключей keys, создавая недостающие записи.
+        keys - словарь {ключ: словарь дополнительных полей для новой записи} или итерируемое ключей.
+        """
+        extra = keys if isinstance(keys, dict) else {}
+        resolved = {}
+        missing = []
+        for key in keys:
+            obj_id = self.cache.get(key)
+            if obj_id is None:
+                missing.append(key)
+            else:
+                resolved[key] = obj_id
+        if not missing:
+            return resolved
+
+        found = self._query(missing)
+        resolved.update(found)
+        to_create = [key for key in missing if key not in found]
+        created = {}
+        if to_create:
+            objs = [self.model(**self.key_values(key), **extra.get(key, {})) for key in to_create]
+            self.model.objects.bulk_create(objs, batch_size=self.batch_size)
+            if all(obj.pk is not None for obj in objs):
+                created = {key: obj.pk for key, obj in zip(to_create, objs)}
+            else:
+                # Бэкенд БД не вернул id из bulk_create - дочитываем их запросом
+                created = self._query(to_create)
+            resolved.update(created)
+
+        for key, obj_id in found.items():
+            self.cache.put(key, obj_id)
+        if created:
+            transaction.on_commit(lambda: self._remember(created))
+        return resolved
+
+    def _remember(self, items):
+        for key, obj_id in items.items():
+            self.cache.put(key, obj_id)
+
+    def _query(self, keys):
+        wanted = set(keys)
+        found = {}
+        for i in range(0, len(keys), self.batch_size):
+            chunk = keys[i:i + self.batch_size]
+            filters = {}
+            for field in self.lookup_fields:
+                filters[f"{field}__in"] = {self.key_values(key)[field] for key in chunk}
+            for row in self.model.objects.filter(**filters).values("id", *self.key_fields):
+                key = self.make_key(row)
+                if key in wanted:
+                    found[key] = row["id"]
+        return found
+
+
+def datetime_smart_key(year, month, day, hour, minute, second, utc_offset):
+    """
+    Вычисляемый ключ DimDateTime: YYYYMMDDHHMMSS * 10000 + код смещения,
+    где код смещения - смещение от UTC в минутах плюс 1440 (всегда 4 цифры).
+    Например, 2024-01-31 23:59:59 +0300 -> 202401312359591620.
+    """
+    offset = int(utc_offset[1:3]) * 60 + int(utc_offset[3:5])
+    if utc_offset[0] == '-':
+        offset = -offset
+    stamp = ((((year * 100 + month) * 100 + day) * 100 + hour) * 100 + minute) * 100 + second
+    return stamp * 10000 + offset + 1440
+
+
+def datetime_smart_key_range(start_date, end_date):
+    """Диапазон вычисляемых ключей DimDateTime, покрывающий дни с start_date по end_date включительно."""
+    start = (start_date.year * 10000 + start_date.month * 100 + start_date.day) * 1000000
+    end = (end_date.year * 10000 + end_date.month * 100 + end_date.day) * 1000000 + 235959
+    return start * 10000, end * 10000 + 9999
+
+
+def use_datetime_smart_keys():
+    return getattr(settings, 'LOGPARSER_DATETIME_SMART_KEYS', False)
+
+
+class SmartDateTimeKeys:
+    """
+    Замена DimensionCache для DimDateTime в режиме вычисляемых ключей:
+    id записи вычисляется из самой временной метки (datetime_smart_key),
+    поэтому поиск по БД не нужен. Записи измерения всё равно создаются
+    (через ignore_conflicts), чтобы дашборд мог фильтровать по log_date, hour и т.д.
+    Кэш лишь запоминает, какие ключи уже записаны в этой сессии.
+    """
+
+    def __init__(self, maxsize=200000, batch_size=500):
+        self.batch_size = batch_size
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def resolve(self, keys):
+        resolved = {}
+        new_objs = []
+        for key in keys:
+            (log_date, log_time, utc_offset, year, month, day, hour, minute, second) = key
+            obj_id = datetime_smart_key(year, month, day, hour, minute, second, utc_offset)
+            resolved[key] = obj_id
+            if self.cache.get(obj_id) is None:
+                new_objs.append(DimDateTime(id=obj_id, **dict(zip(DATETIME_KEY_FIELDS, key))))
+        if new_objs:
+            DimDateTime.objects.bulk_create(new_objs, batch_size=self.batch_size, ignore_conflicts=True)
+            transaction.on_commit(lambda: self._remember(new_objs))
+        return resolved
+
+    def _remember(self, objs):
+        for obj in objs:
+            self.cache.put(obj.id, True)
+
+
+class DimensionCaches:
+    """
+    Набор кэшей измерений для одной сессии загрузки.
+    smart_datetime_keys включает вычисляемые ключи DimDateTime
+    (по умолчанию - настройка LOGPARSER_DATETIME_SMART_KEYS).
+    """
+
+    def __init__(self, maxsize=200000, smart_datetime_keys=None):
+        if smart_datetime_keys is None:
+            smart_datetime_keys = use_datetime_smart_keys()
+        self.ips = DimensionCache(DimIP, ("ip_address",), maxsize=maxsize)
+        if smart_datetime_keys:
+            self.datetimes = SmartDateTimeKeys(maxsize=maxsize)
+        else:
+            # Фильтр по полям индекса DimDateTime (log_date, log_time, utc_offset)
+            self.datetimes = DimensionCache(DimDateTime, DATETIME_KEY_FIELDS,
+                                            lookup_fields=("log_date", "log_time", "utc_offset"), maxsize=maxsize)
+        self.requests = DimensionCache(DimRequest, REQUEST_KEY_FIELDS, maxsize=maxsize)
+        self.user_agents = DimensionCache(DimUserAgent, ("original_user_agent",), maxsize=maxsize)
+
+
+def datetime_key(fields):
+    """Ключ DimDateTime (порядок DATETIME_KEY_FIELDS) из результата TimestampParser.parse_fields."""
+    (log_date, log_time, year, month, day, hour, minute, second, utc_offset) = fields
+    return (log_date, log_time, utc_offset, year, month, day, hour, minute, second)
+
+
+@transaction.atomic
+def store_batch(batch, server, dimensions, raw_insert=False, inline_aggregates=False):
+    """
+    Сохраняет порцию LogBatch: разрешает измерения через кэши dimensions
+    (DimensionCaches) и создаёт записи FactLog. Ключи измерений строятся
+    по столбцам, а не по строкам: временная метка и user-agent - по разу
+    на различное значение. Если в порции есть разбор user-agent,
+    заполняется и ссылка на DimUserAgent.
+    raw_insert=True вставляет строки FactLog через executemany, минуя
+    создание экземпляров модели (см. режим --bulk_mode загрузчика).
+    В той же транзакции к итогам ServerStatusTotal прибавляются счётчики
+    порции. Номер поколения IngestGeneration увеличивает вызывающий - один раз
+    на файл или порцию слежения, а не на каждую порцию (иначе кэши дашборда
+    сбрасывались бы каждые chunk_size строк).
+    inline_aggregates=True также прибавляет меры порции к IpDateAggregate,
+    DateStatusAggregate, HourlyRollup и скетчам RequestLatencySketch,
+    DailyUniqueSketch и DailyTopValues, так что отдельный запуск
+    aggregate_logs не нужен.
+    Возвращает количество созданных записей FactLog.
+    """
+    if not len(batch):
+        return 0
+
+    ip_ids = dimensions.ips.resolve(set(batch.ips))
+    dt_keys = {dt_str: datetime_key(fields) for dt_str, fields in batch.datetime_fields.items()}
+    dt_key_ids = dimensions.datetimes.resolve(set(dt_keys.values()))
+    dt_ids = {dt_str: dt_key_ids[key] for dt_str, key in dt_keys.items()}
+    request_keys = list(zip(batch.methods, batch.paths, batch.http_versions))
+    req_ids = dimensions.requests.resolve(set(request_keys))
+
+    ua_ids = {}
+    if batch.user_agent_details is not None:
+        ua_ids = dimensions.user_agents.resolve(batch.user_agent_details)
+
+    # Итоги ServerStatusTotal ведутся всегда, остальные агрегаты - только с inline_aggregates
+    watermarks = lock_watermarks(None if inline_aggregates else [HEADLINE_WATERMARK])
+
+    # Значения в порядке FACT_COLUMNS; user_agent - оригинальная строка для справки,
+    # user_agent_detail_id - ссылка на запись в DimUserAgent
+    rows = [
+        (ip_ids[ip], dt_ids[dt_str], req_ids[request_key], status_code, bytes_sent, referrer,
+         user_agent, ua_ids.get(user_agent), remote_user, response_time, server)
+        for (ip, dt_str, request_key, status_code, bytes_sent, referrer, user_agent,
+             remote_user, response_time) in zip(
+            batch.ips, batch.timestamps, request_keys, batch.status_codes.tolist(),
+            batch.bytes_sent.tolist(), batch.referrers, batch.user_agents, batch.remote_users,
+            batch.response_times.tolist(),
+        )
+    ]
+    if raw_insert:
+        with connection.cursor() as cursor:
+            cursor.executemany(fact_insert_sql(), rows)
+    else:
+        FactLog.objects.bulk_create([FactLog(**dict(zip(FACT_COLUMNS, row))) for row in rows],
+                                    batch_size=5000)
+    add_headline_counts(server, batch.status_codes.tolist())
+    if inline_aggregates:
+        store_batch_aggregates(batch, server, rows)
+    advance_watermarks(watermarks)
+    return len(rows)
+
+
+def store_batch_aggregates(batch, server, rows):
+    """Прибавляет меры только что вставленной порции (rows - строки FACT_COLUMNS) к агрегатам."""
+    status_codes = batch.status_codes.tolist()
+    datetime_fields = [batch.datetime_fields[dt_str] for dt_str in batch.timestamps]
+    dates = [fields[0] for fields in datetime_fields]
+    add_daily_counts([row[0] for row in rows], dates, status_codes)
+
+    browsers = oses = [''] * len(rows)
+    if batch.user_agent_details is not None:
+        details = [batch.user_agent_details[ua_string] for ua_string in batch.user_agents]
+        browsers = [detail["browser_family"] for detail in details]
+        oses = [detail["os_family"] for detail in details]
+    hours = [fields[5] for fields in datetime_fields]
+    keys = zip(dates, hours, [server] * len(rows), batch.methods, status_codes, browsers, oses)
+    response_times = batch.response_times.tolist()
+    add_hourly_rollup(keys, batch.bytes_sent.tolist(), response_times)
+    LATENCY_SKETCHES.add_values(zip(zip(dates, [row[2] for row in rows]), response_times))
+    UNIQUE_SKETCHES.add_values(pair for date, ip, user_agent in zip(dates, batch.ips, batch.user_agents)
+                               for pair in unique_values(date, server, ip, user_agent))
+    # В rows уже id измерений: ip_id - row[0], request_id - row[2], строка user-agent - row[6]
+    TOP_VALUES.add_values(pair for date, row in zip(dates, rows)
+                          for pair in top_values(date, row[2], row[0], row[6]))
+
+
+def fact_insert_sql():
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(FactLog._meta.get_field(name).column) for name in FACT_COLUMNS)
+    placeholders = ", ".join(["%s"] * len(FACT_COLUMNS))
+    return f"INSERT INTO {qn(FactLog._meta.db_table)} ({columns}) VALUES ({placeholders})"
+
+
+@contextmanager
+def sqlite_bulk_load(defer_indexes=False):
+    """
+    Режим массовой загрузки SQLite: на время загрузки включает журнал WAL
+    и synchronous=NORMAL (без fsync на каждую транзакцию), по окончании
+    возвращает прежние значения. defer_indexes=True удаляет вторичные индексы
+    FactLog и строит их заново в конце - один раз вместо обновления на каждой вставке.
+    synchronous действует только на текущее соединение, поэтому повторяется для
+    соединений, открытых внутри режима (например, после connections.close_all()).
+    """
+    table = FactLog._meta.db_table
+    alias = connection.alias
+
+    def relax_synchronous(sender, connection, **kwargs):
+        if connection.alias == alias:
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous=NORMAL")
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute("PRAGMA synchronous")
+        synchronous = cursor.fetchone()[0]
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        indexes = []
+        if defer_indexes:
+            # Индексы с sql = NULL создаются SQLite сам (UNIQUE, PRIMARY KEY) - их не трогаем
+            cursor.execute("SELECT name, sql FROM sqlite_master "
+                           "WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL", [table])
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+    connection_created.connect(relax_synchronous)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(relax_synchronous)
+        with connection.cursor() as cursor:
+            for _, sql in indexes:
+                cursor.execute(sql)
+            cursor.execute(f"PRAGMA synchronous={int(synchronous)}")
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+
+
+def file_fingerprint(filepath):
+    """
+    Возвращает (размер, хэш начала, отпечаток) файла. Отпечаток - размер
+    плюс SHA-1 первых и последних FINGERPRINT_BLOCK байт; хэш начала
+    считается по первым min(размер, FINGERPRINT_BLOCK) байтам.
+    """
+    with open(filepath, 'rb') as f:
+        return read_fingerprint(f, os.fstat(f.fileno()).st_size)
+
+
+def read_fingerprint(f, size):
+    """
+    То же, что file_fingerprint, для первых size байт открытого файла f
+    (двоичный режим); позиция чтения файла сохраняется.
+    """
+    position = f.tell()
+    try:
+        f.seek(0)
+        head = f.read(min(size, FINGERPRINT_BLOCK))
+        f.seek(max(size - FINGERPRINT_BLOCK, 0))
+        tail = f.read(min(size, FINGERPRINT_BLOCK))
+    finally:
+        f.seek(position)
+    head_hash = hashlib.sha1(head).hexdigest()
+    return size, head_hash, f"{size}:{head_hash}:{hashlib.sha1(tail).hexdigest()}"
+
+
+def blocks_fingerprint(blocks):
+    """То же, что file_fingerprint, для данных из списка байтовых блоков."""
+    size = sum(len(block) for block in blocks)
+    head = bytearray()
+    for block in blocks:
+        if len(head) >= FINGERPRINT_BLOCK:
+            break
+        head += block[:FINGERPRINT_BLOCK - len(head)]
+    tail = []
+    tail_size = 0
+    for block in reversed(blocks):
+        if tail_size >= FINGERPRINT_BLOCK:
+            break
+        tail.append(block[-(FINGERPRINT_BLOCK - tail_size):])
+        tail_size += len(tail[-1])
+    head_hash = hashlib.sha1(head).hexdigest()
+    tail_hash = hashlib.sha1(b''.join(reversed(tail))).hexdigest()
+    return size, head_hash, f"{size}:{head_hash}:{tail_hash}"
+
+
+def prefix_hash(filepath, length):
+    """SHA-1 первых length байт файла."""
+    with open(filepath, 'rb') as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+
+def get_ledger_entry(filepath):
+    """
+    Находит или создаёт запись IngestedFile для файла. Сначала ищется запись
+    с тем же путём и тем же началом: если файл с тех пор дописан, продолжается
+    прежняя запись - с её смещения. Начало сравнивается по длине, сохранённой
+    в записи (head_length): у файла меньше FINGERPRINT_BLOCK дописанные строки
+    попадают в хэш начала, поэтому новый хэш с прежним сравнивать нельзя.
+    Затем - запись с тем же отпечатком (файл переименован), но только для файлов
+    не меньше FINGERPRINT_BLOCK: отпечаток пустого или короткого файла совпадает
+    у разных файлов с одинаковым началом.
+    """
+    size, head_hash, fingerprint = file_fingerprint(filepath)
+    head_length = min(size, FINGERPRINT_BLOCK)
+    prefix_hashes = {head_length: head_hash}
+    # size__lte: запись, которую --follow продвигает, может уже охватывать весь файл
+    for entry in IngestedFile.objects.filter(path=filepath, size__lte=size).order_by('-size', '-id'):
+        if entry.head_length not in prefix_hashes:
+            prefix_hashes[entry.head_length] = prefix_hash(filepath, entry.head_length)
+        if prefix_hashes[entry.head_length] != entry.head_hash:
+            continue
+        if entry.fingerprint == fingerprint:
+            return entry
+        # Файл того же размера (запись продвигал --follow) остаётся в прежнем состоянии
+        entry.completed = entry.completed and entry.size == size
+        entry.size = size
+        entry.fingerprint = fingerprint
+        entry.head_hash = head_hash
+        entry.head_length = head_length
+        entry.save(update_fields=['size', 'fingerprint', 'head_hash', 'head_length', 'completed', 'updated_at'])
+        return entry
+    if size >= FINGERPRINT_BLOCK:
+        entry = IngestedFile.objects.filter(fingerprint=fingerprint).first()
+        if entry is not None:
+            return entry
+    return IngestedFile.objects.create(fingerprint=fingerprint, path=filepath, size=size,
+                                       head_hash=head_hash, head_length=head_length)
+
+
+def advance_ledger_entry(entry, f, offset, lines_count):
+    """
+    Продвигает запись журнала на lines_count строк, дочитанных из открытого
+    файла f до смещения offset (режим --follow). Если дочитан весь размер
+    из записи, запись начинает описывать первые offset байт: они загружены
+    целиком, а следующий запуск (пакетный или --follow) узнает по ним файл
+    и продолжит с offset.
+    Вызывается в той же транзакции, что и запись строк.
+    """
+    entry.offset = offset
+    entry.line_count += lines_count
+    if offset >= entry.size:
+        entry.size, entry.head_hash, entry.fingerprint = read_fingerprint(f, offset)
+        entry.head_length = min(offset, FINGERPRINT_BLOCK)
+        entry.completed = True
+    entry.save(update_fields=['offset', 'line_count', 'size', 'head_hash', 'fingerprint', 'head_length',
+                              'completed', 'updated_at'])
+
+
+def ingest_file(filepath, process_chunk, chunk_size=10000, log=print, progress=None):
+    """
+    Загружает файл порциями по chunk_size строк с учётом журнала IngestedFile:
+    уже загруженные файлы пропускаются, частично загруженные продолжаются
+    с сохранённого смещения. Каждая порция (process_chunk(lines, server))
+    фиксируется в одной транзакции с обновлением журнала, поэтому после сбоя
+    повторный запуск не создаёт дубликатов FactLog.
+    progress(n) вызывается после каждой зафиксированной порции из n строк.
+    Возвращает количество загруженных строк или None, если файл уже был загружен.
+    """
+    entry = get_ledger_entry(filepath)
+    if entry.completed:
+        log(f"Файл {filepath} уже загружен ({entry.line_count} строк), пропускаю.")
+        return None
+    if entry.offset:
+        log(f"Продолжаю загрузку {filepath} с байта {entry.offset} из {entry.size}.")
+    server = server_for_file(filepath)
+    total = 0
+    try:
+        with open_log_file(filepath) as f:
+            # Для сжатых файлов смещение считается в распакованных данных
+            f.seek(entry.offset)
+            for lines, offset in read_line_chunks(f, chunk_size, entry.offset):
+                with transaction.atomic():
+                    process_chunk(lines, server)
+                    entry.offset = offset
+                    entry.line_count += len(lines)
+                    entry.save(update_fields=['offset', 'line_count', 'updated_at'])
+                total += len(lines)
+                if progress:
+                    progress(len(lines))
+    finally:
+        # Одно новое поколение на файл - и после сбоя, если порции успели зафиксироваться
+        if total:
+            bump_generation()
+    entry.completed = True
+    entry.save(update_fields=['completed', 'updated_at'])
+    return total
+
+
+def get_stream_ledger_entry(name, size, head_hash, fingerprint):
+    """
+    Находит или создаёт запись IngestedFile для лога, загружаемого потоком.
+    У потока нет пути, поэтому он узнаётся только по отпечатку содержимого:
+    те же данные (загруженные потоком или из файла) продолжают прежнюю запись.
+    Новая запись получает путь STREAM_LEDGER_PREFIX + name.
+    """
+    entry = IngestedFile.objects.filter(fingerprint=fingerprint).order_by('-completed', '-offset').first()
+    if entry is not None:
+        return entry
+    return IngestedFile.objects.create(fingerprint=fingerprint, path=STREAM_LEDGER_PREFIX + name, size=size,
+                                       head_hash=head_hash, head_length=min(size, FINGERPRINT_BLOCK))
+
+
+def ingest_stream(blocks, name, process_chunk, chunk_size=10000, log=print, progress=None, fingerprint=None):
+    """
+    Загружает лог из потока байтовых блоков (например, UploadedFile.chunks())
+    без промежуточного файла: блоки распаковываются, если сжаты, делятся на строки
+    и порциями по chunk_size передаются в process_chunk(lines, server). Сервер
+    определяется по имени name. Журнал IngestedFile ведётся так же, как в
+    ingest_file (смещения - в распакованных данных): уже загруженные данные
+    пропускаются, прерванная загрузка продолжается. fingerprint - результат
+    file_fingerprint/blocks_fingerprint для исходных (сжатых) блоков; если не
+    задан, блоки собираются в список и отпечаток считается по ним.
+    Возвращает количество загруженных строк или None, если данные уже были загружены.
+    """
+    if fingerprint is None:
+        blocks = list(blocks)
+        fingerprint = blocks_fingerprint(blocks)
+    entry = get_stream_ledger_entry(name, *fingerprint)
+    if entry.completed:
+        log(f"Файл {name} уже загружен ({entry.line_count} строк), пропускаю.")
+        return None
+    if entry.offset:
+        log(f"Продолжаю загрузку {name} с байта {entry.offset}.")
+    server = server_for_file(name)
+    total = 0
+    data = skip_bytes(decompress_blocks(blocks), entry.offset)
+    try:
+        for lines, offset in split_line_blocks(data, chunk_size, entry.offset):
+            with transaction.atomic():
+                process_chunk(lines, server)
+                entry.offset = offset
+                entry.line_count += len(lines)
+                entry.save(update_fields=['offset', 'line_count', 'updated_at'])
+            total += len(lines)
+            if progress:
+                progress(len(lines))
+    finally:
+        if total:
+            bump_generation()
+    entry.completed = True
+    entry.save(update_fields=['completed', 'updated_at'])
+    return total
@@ -1,42 +1,29 @@
 from django.core.management.base import BaseCommand
-from django.db.models import Count
-from django.db import transaction
-from logparser.models import FactLog, IpDateAggregate, DateStatusAggregate
+from logparser.aggregates import AGGREGATES, bump_generation, update_aggregates
 
 class Command(BaseCommand):
-    help = 'Пересчитывает агрегаты: запросы по IP/дате и по статус‑коду/дате.'
+    help = ('Обновляет агрегаты: итоги по серверам/классам статусов, запросы по IP/дате, по статус‑коду/дате, почасовой куб HourlyRollup '
+            'и скетчи: квантили времени ответа, уникальные посетители и самые частые эндпоинты/IP/user-agent. '
+            'По умолчанию учитываются только записи FactLog, добавленные после прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать агрегаты заново по всей таблице FactLog')
 
     def handle(self, *args, **opts):
         self.stdout.write("Starting aggregation…")
-        with transaction.atomic():
-            # 1) Агрегат по IP + дате
-            qs1 = (FactLog.objects
-                        .values('ip_id', 'datetime_entry__log_date')
-                        .annotate(cnt=Count('id')))
-            IpDateAggregate.objects.all().delete()
-            objs1 = [
-                IpDateAggregate(
-                    ip_id=rec['ip_id'],
-                    log_date=rec['datetime_entry__log_date'],
-                    count=rec['cnt']
-                )
-                for rec in qs1
-            ]
-            IpDateAggregate.objects.bulk_create(objs1, batch_size=5000)
-
-            # 2) Агрегат по статус-коду + дате
-            qs2 = (FactLog.objects
-                        .values('datetime_entry__log_date', 'status_code')
-                        .annotate(cnt=Count('id')))
-            DateStatusAggregate.objects.all().delete()
-            objs2 = [
-                DateStatusAggregate(
-                    log_date   = rec['datetime_entry__log_date'],
-                    status_code= rec['status_code'],
-                    count      = rec['cnt']
-                )
-                for rec in qs2
-            ]
-            DateStatusAggregate.objects.bulk_create(objs2, batch_size=5000)
-
+        changed = opts['full']
+        for name in AGGREGATES:
+            start_id, last_id, touched = update_aggregates(name, full=opts['full'])
+            if last_id == start_id:
+                self.stdout.write(f"[{name}] Новых записей FactLog нет.")
+                continue
+            changed = True
+            self.stdout.write(f"[{name}] Учтены записи FactLog с id {start_id + 1} по {last_id}" +
+                              (" (полный пересчёт)." if start_id == 0 else "."))
+            for model, rows in touched.items():
+                self.stdout.write(f"{model.__name__}: обновлено строк {rows}")
+        if changed:
+            # Кэши дашборда, посчитанные по прежним агрегатам, больше не используются
+            bump_generation()
         self.stdout.write(self.style.SUCCESS("Aggregation done."))
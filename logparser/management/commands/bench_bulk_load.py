@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from logparser.columnar import parse_batch
+from logparser.ingest import DimensionCaches, store_batch
+from logparser.management.commands.bench_datetime_keys import BenchmarkRollback, make_sample_lines
+from logparser.management.commands.load_logs import NEW_LOG_PATTERN
+from logparser.parse_utils import TimestampParser
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк записи FactLog: ORM bulk_create против executemany (--bulk_mode загрузчика) "
+            "на одних и тех же распарсенных порциях, строк в секунду. Все записи откатываются "
+            "по окончании, поэтому влияние PRAGMA (synchronous=NORMAL) на фиксацию транзакций "
+            "здесь не видно - его показывает итоговая строка load_logs --bulk_mode.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=200000, help='Количество строк для загрузки')
+        parser.add_argument('--chunk_size', type=int, default=10000, help='Размер порции загрузки')
+
+    def handle(self, *args, **options):
+        lines = make_sample_lines(options['lines'])
+        chunk_size = options['chunk_size']
+        parser = TimestampParser()
+        batches = [parse_batch(lines[i:i + chunk_size], NEW_LOG_PATTERN, parser)
+                   for i in range(0, len(lines), chunk_size)]
+        results = []
+        # Каждый режим записывается в своей транзакции, которая затем откатывается
+        for raw_insert, label in ((False, 'ORM bulk_create'), (True, 'executemany (--bulk_mode)')):
+            try:
+                with transaction.atomic():
+                    dimensions = DimensionCaches()
+                    rows = 0
+                    t0 = time.perf_counter()
+                    for batch in batches:
+                        rows += store_batch(batch, 'bench', dimensions, raw_insert=raw_insert)
+                    results.append((label, rows, time.perf_counter() - t0))
+                    raise BenchmarkRollback
+            except BenchmarkRollback:
+                pass
+
+        for label, rows, elapsed in results:
+            self.stdout.write(f"{label}: {rows} строк за {elapsed:.2f} с ({rows / elapsed:,.0f} строк/с)")
+        self.stdout.write(self.style.SUCCESS("Все записи бенчмарка откачены."))
@@ -0,0 +1,59 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logparser.columnar import parse_batch
+from logparser.ingest import datetime_key
+from logparser.management.commands.bench_datetime_keys import make_sample_lines
+from logparser.management.commands.load_logs import NEW_LOG_PATTERN, parse_log_line
+from logparser.parse_utils import TimestampParser
+
+
+def keys_from_dicts(lines):
+    """Прежний путь: словарь на строку, ключи измерений собираются по строкам."""
+    parsed = [p for p in map(parse_log_line, lines) if p]
+    ips = {p["ip"] for p in parsed}
+    datetimes = {(p["date"], p["time"], p["utc_offset"], p["year"], p["month"], p["day"],
+                  p["hour"], p["minute"], p["second"]) for p in parsed}
+    requests = {(p["method"], p["path"], p["http_version"]) for p in parsed}
+    return len(parsed), ips, datetimes, requests
+
+
+def keys_from_batch(lines):
+    """Колоночный путь: LogBatch, ключи измерений собираются по столбцам."""
+    batch = parse_batch(lines, NEW_LOG_PATTERN, TimestampParser())
+    ips = set(batch.ips)
+    datetimes = {datetime_key(fields) for fields in batch.datetime_fields.values()}
+    requests = set(zip(batch.methods, batch.paths, batch.http_versions))
+    return len(batch), ips, datetimes, requests
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк разбора порции строк: словарь на каждую строку против колоночного "
+            "LogBatch - время и пиковая память на порцию.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk_size', type=int, default=10000, help='Строк в порции')
+        parser.add_argument('--chunks', type=int, default=20, help='Количество порций')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        lines = make_sample_lines(chunk_size * options['chunks'])
+        chunks = [lines[i:i + chunk_size] for i in range(0, len(lines), chunk_size)]
+        results = {}
+        for label, func in (('словари', keys_from_dicts), ('столбцы', keys_from_batch)):
+            t0 = time.perf_counter()
+            outputs = [func(chunk) for chunk in chunks]
+            elapsed = time.perf_counter() - t0
+            # Пиковую память меряем отдельно: tracemalloc заметно замедляет выполнение
+            tracemalloc.start()
+            func(chunks[0])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[label] = outputs
+            self.stdout.write(f"{label}: {elapsed:.3f} с ({len(lines) / elapsed:,.0f} строк/с), "
+                              f"пик памяти на порцию {peak / 1024 / 1024:.1f} МБ")
+        if results['словари'] != results['столбцы']:
+            raise CommandError("Ключи измерений, собранные двумя способами, расходятся.")
+        self.stdout.write(self.style.SUCCESS("Ключи измерений совпадают."))
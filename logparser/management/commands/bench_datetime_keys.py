@@ -0,0 +1,81 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from logparser.ingest import DimensionCaches, datetime_smart_key_range
+from logparser.management.commands.load_logs import process_chunk
+from logparser.models import FactLog
+
+
+class BenchmarkRollback(Exception):
+    """Откатывает все записи, сделанные бенчмарком."""
+
+
+def make_sample_lines(count, lines_per_second=5, start=datetime.datetime(2024, 1, 1), seed=1):
+    """Генерирует синтетические строки лога в формате NEW_LOG_PATTERN."""
+    rnd = random.Random(seed)
+    methods = ["GET", "GET", "GET", "POST", "PUT", "DELETE"]
+    statuses = [200, 200, 200, 201, 301, 404, 500]
+    lines = []
+    for i in range(count):
+        stamp = start + datetime.timedelta(seconds=i // lines_per_second)
+        lines.append(
+            f'10.0.{rnd.randint(0, 30)}.{rnd.randint(0, 255)} - - [{stamp:%Y-%m-%d %H:%M:%S} +0300] '
+            f'"{rnd.choice(methods)} /api/item/{rnd.randint(0, 200)} HTTP/1.1" {rnd.choice(statuses)} '
+            f'{rnd.randint(0, 5000)} "-" "Mozilla/5.0 (bench {rnd.randint(0, 20)})" {rnd.randint(1, 900)}\n'
+        )
+    return lines
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк суррогатных и вычисляемых ключей DimDateTime: загрузка и запрос "
+            "как в filter_logs. Все записи откатываются по окончании.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=200000, help='Количество строк для загрузки')
+        parser.add_argument('--chunk_size', type=int, default=10000, help='Размер порции загрузки')
+        parser.add_argument('--lines_per_second', type=int, default=1, help='Строк лога на одну секунду')
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз повторять запрос')
+
+    def handle(self, *args, **options):
+        lines = make_sample_lines(options['lines'], lines_per_second=options['lines_per_second'])
+        chunk_size = options['chunk_size']
+        # Запрос дашборда за первый день загруженных данных
+        start_date = end_date = datetime.date(2024, 1, 1)
+        results = []
+        # Каждый режим загружается в своей транзакции, которая затем откатывается
+        for smart_keys, label in ((False, 'суррогатные ключи'), (True, 'вычисляемые ключи')):
+            try:
+                with transaction.atomic():
+                    dimensions = DimensionCaches(smart_datetime_keys=smart_keys)
+                    t0 = time.perf_counter()
+                    for i in range(0, len(lines), chunk_size):
+                        process_chunk(lines[i:i + chunk_size], 'bench', dimensions)
+                    ingest_time = time.perf_counter() - t0
+
+                    if smart_keys:
+                        first_key, last_key = datetime_smart_key_range(start_date, end_date)
+                        queryset = FactLog.objects.filter(datetime_entry_id__gte=first_key,
+                                                          datetime_entry_id__lte=last_key)
+                    else:
+                        queryset = FactLog.objects.filter(datetime_entry__log_date__range=(start_date, end_date))
+                    query_time = None
+                    for _ in range(options['repeat']):
+                        t0 = time.perf_counter()
+                        list(queryset.values('status_code').annotate(count=Count('id')))
+                        elapsed = time.perf_counter() - t0
+                        query_time = elapsed if query_time is None else min(query_time, elapsed)
+                    results.append((label, ingest_time, query_time))
+                    raise BenchmarkRollback
+            except BenchmarkRollback:
+                pass
+
+        total = len(lines)
+        for label, ingest_time, query_time in results:
+            self.stdout.write(f"{label}: загрузка {ingest_time:.2f} с ({total / ingest_time:,.0f} строк/с), "
+                              f"запрос filter_logs {query_time * 1000:.1f} мс")
+        self.stdout.write(self.style.SUCCESS("Все записи бенчмарка откачены."))
@@ -0,0 +1,72 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logparser.management.commands.bench_datetime_keys import make_sample_lines
+from logparser.management.commands.load_logs import parse_log_line
+from logparser.parse_utils import open_log_file, read_line_chunks
+
+WRITERS = (
+    ('.log', open),
+    ('.gz', gzip.open),
+    ('.bz2', bz2.open),
+    ('.xz', lzma.open),
+)
+
+
+def read_naive(filepath):
+    """Прежний способ: построчное чтение текстового файла."""
+    with open(filepath, 'r') as f:
+        return [line for line in f]
+
+
+def read_blocks(filepath):
+    """Блочное чтение с распаковкой на лету, как в ingest_file."""
+    lines = []
+    with open_log_file(filepath) as f:
+        for chunk, _ in read_line_chunks(f, 10000):
+            lines.extend(chunk)
+    return lines
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк чтения лог-файлов: построчное чтение текста против блочного чтения "
+            "с распаковкой gzip/bz2/xz на лету.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=500000, help='Количество строк в файле')
+        parser.add_argument('--parse', action='store_true',
+                            help='Дополнительно разбирать строки parse_log_line')
+
+    def handle(self, *args, **options):
+        sample = make_sample_lines(options['lines'])
+        data = ''.join(sample).encode('utf-8')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for suffix, writer in WRITERS:
+                path = os.path.join(tmpdir, 'bench' + suffix)
+                with writer(path, 'wb') as f:
+                    f.write(data)
+                paths.append(path)
+
+            cases = [('текст построчно', read_naive, paths[0])]
+            cases += [(f'блоками {os.path.basename(path)}', read_blocks, path) for path in paths]
+            for label, reader, path in cases:
+                t0 = time.perf_counter()
+                lines = reader(path)
+                if options['parse']:
+                    parsed = [parse_log_line(line) for line in lines]
+                    if None in parsed:
+                        raise CommandError(f"{label}: не удалось разобрать часть строк")
+                elapsed = time.perf_counter() - t0
+                if len(lines) != len(sample):
+                    raise CommandError(f"{label}: прочитано {len(lines)} строк вместо {len(sample)}")
+                size = os.path.getsize(path)
+                self.stdout.write(f"{label}: {elapsed:.3f} с ({len(lines) / elapsed:,.0f} строк/с), "
+                                  f"размер файла {size / 1024 / 1024:.1f} МБ")
+        self.stdout.write(self.style.SUCCESS("Готово."))
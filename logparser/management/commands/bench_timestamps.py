@@ -0,0 +1,53 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logparser.parse_utils import DT_FORMAT, TimestampParser
+
+
+def parse_with_strptime(dt_str):
+    """Прежний способ разбора временной метки в parse_log_line."""
+    dt_obj = datetime.datetime.strptime(dt_str, DT_FORMAT)
+    return (dt_obj.date(), dt_obj.time(), dt_obj.year, dt_obj.month, dt_obj.day,
+            dt_obj.hour, dt_obj.minute, dt_obj.second, dt_obj.strftime("%z"))
+
+
+class Command(BaseCommand):
+    help = "Микро-бенчмарк: разбор временных меток через strptime и через TimestampParser."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1000000, help='Количество временных меток')
+        parser.add_argument('--lines_per_second', type=int, default=10,
+                            help='Сколько строк подряд приходится на одну секунду')
+        parser.add_argument('--min_speedup', type=float, default=5.0,
+                            help='Минимально допустимое ускорение')
+
+    def handle(self, *args, **options):
+        lines = options['lines']
+        per_second = max(options['lines_per_second'], 1)
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone(datetime.timedelta(hours=3)))
+        samples = [
+            (start + datetime.timedelta(seconds=i // per_second)).strftime(DT_FORMAT)
+            for i in range(lines)
+        ]
+
+        t0 = time.perf_counter()
+        expected = [parse_with_strptime(s) for s in samples]
+        strptime_time = time.perf_counter() - t0
+
+        parser = TimestampParser()
+        t0 = time.perf_counter()
+        actual = [parser.parse_fields(s) for s in samples]
+        fast_time = time.perf_counter() - t0
+
+        if actual != expected:
+            raise CommandError("Результаты TimestampParser расходятся с strptime.")
+
+        speedup = strptime_time / fast_time if fast_time else float('inf')
+        self.stdout.write(f"Строк: {lines}, строк на секунду: {per_second}")
+        self.stdout.write(f"strptime:        {strptime_time:.3f} с ({lines / strptime_time:,.0f} строк/с)")
+        self.stdout.write(f"TimestampParser: {fast_time:.3f} с ({lines / fast_time:,.0f} строк/с)")
+        if speedup < options['min_speedup']:
+            raise CommandError(f"Ускорение {speedup:.1f}x меньше требуемых {options['min_speedup']}x")
+        self.stdout.write(self.style.SUCCESS(f"Ускорение: {speedup:.1f}x"))
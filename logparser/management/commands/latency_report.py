@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from logparser.aggregates import LATENCY_WATERMARK, aggregates_are_current, latency_percentiles
+from logparser.models import DimRequest
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Command(BaseCommand):
+    help = ("Квантили времени ответа (p50/p95/p99) по эндпоинтам за период - "
+            "объединением дневных скетчей RequestLatencySketch, без чтения FactLog.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start_date', type=date.fromisoformat, required=True, help='Начало периода (ГГГГ-ММ-ДД)')
+        parser.add_argument('--end_date', type=date.fromisoformat, required=True, help='Конец периода (ГГГГ-ММ-ДД)')
+        parser.add_argument('--path', help='Только эндпоинты, путь которых содержит эту строку')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько эндпоинтов с наибольшим числом запросов вывести')
+
+    def handle(self, *args, **options):
+        if options['start_date'] > options['end_date']:
+            raise CommandError("Начало периода позже конца.")
+        if not aggregates_are_current(LATENCY_WATERMARK):
+            self.stderr.write("Скетчи отстают от FactLog - запустите aggregate_logs.")
+
+        request_ids = None
+        if options['path']:
+            request_ids = list(DimRequest.objects.filter(path__contains=options['path']).values_list('id', flat=True))
+        stats = latency_percentiles(options['start_date'], options['end_date'], QUANTILES, request_ids)
+        top = sorted(stats.items(), key=lambda item: item[1][0], reverse=True)[:options['limit']]
+        requests = DimRequest.objects.in_bulk([request_id for request_id, _ in top])
+
+        self.stdout.write(f"{'Запросов':>10} {'p50':>10} {'p95':>10} {'p99':>10}  Эндпоинт")
+        for request_id, (count, values) in top:
+            cells = " ".join(f"{v:>10.1f}" if v is not None else f"{'-':>10}" for v in values)
+            self.stdout.write(f"{count:>10} {cells}  {requests[request_id]}")
@@ -1,11 +1,27 @@
 import os
 import re
-import datetime
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import django
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
+from django.db import connection, connections, transaction
 from user_agents import parse as parse_user_agent
 
-from logparser.models import DimIP, DimDateTime, DimRequest, DimUserAgent, FactLog
+from logparser.aggregates import bump_generation
+from logparser.columnar import parse_batch
+from logparser.follow import FollowedFile, LogFollower
+from logparser.ingest import (
+    USER_AGENT_FIELDS, DimensionCaches, advance_ledger_entry, get_ledger_entry, ingest_file, server_for_file,
+    sqlite_bulk_load,
+    store_batch,
+)
+from logparser.models import DimUserAgent
+from logparser.parse_utils import (
+    LRUCache, TimestampParser, detect_compression, is_log_file, open_log_file, read_line_blocks,
+)
 
 # Регулярное выражение для парсинга строки лога
 NEW_LOG_PATTERN = re.compile(
@@ -21,250 +37,381 @@ NEW_LOG_PATTERN = re.compile(
     r'(?P<response_time>\d+)$'
 )
 
-def parse_datetime(dt_str):
-    dt_format = "%Y-%m-%d %H:%M:%S %z"
-    return datetime.datetime.strptime(dt_str, dt_format)
+# Один разборщик временных меток на процесс: он хранит кэш часовых поясов
+# и результат разбора предыдущей строки.
+timestamp_parser = TimestampParser()
+
+# Различных user-agent в логе немного (сотни на миллионы строк), поэтому
+# результат разбора кэшируется по исходной строке.
+user_agent_cache = LRUCache(maxsize=10000)
+
+def parse_user_agent_details(ua_string):
+    """
+    Возвращает словарь с полями USER_AGENT_FIELDS для строки user-agent,
+    обращаясь к user_agents.parse только при промахе кэша.
+    """
+    details = user_agent_cache.get(ua_string)
+    if details is None:
+        user_agent = parse_user_agent(ua_string)
+        details = {
+            "browser_family": user_agent.browser.family,
+            "browser_version": user_agent.browser.version_string,
+            "os_family": user_agent.os.family,
+            "os_version": user_agent.os.version_string,
+            "device_family": user_agent.device.family,
+            "is_mobile": user_agent.is_mobile,
+            "is_tablet": user_agent.is_tablet,
+            "is_pc": user_agent.is_pc,
+        }
+        user_agent_cache.put(ua_string, details)
+    return details
 
-def parse_log_line(line):
+def warm_user_agent_cache():
     """
-    Парсит строку лога и возвращает словарь с данными.
-    Дополнительно анализирует user-agent для получения подробных данных.
+    Заполняет кэш уже разобранными user-agent из DimUserAgent
+    (самые новые записи, не больше размера кэша).
+    Возвращает количество загруженных записей.
     """
-    match = NEW_LOG_PATTERN.match(line)
-    if not match:
-        return None
-    try:
-        dt_obj = parse_datetime(match.group('datetime'))
-    except ValueError:
-        return None
+    rows = list(DimUserAgent.objects.order_by('-id')
+                .values("original_user_agent", *USER_AGENT_FIELDS)[:user_agent_cache.maxsize])
+    for row in reversed(rows):
+        ua_string = row.pop("original_user_agent")
+        user_agent_cache.put(ua_string, row)
+    return len(rows)
 
-    ua_string = match.group('user_agent')
-    user_agent = parse_user_agent(ua_string)
+def split_file_ranges(filepath, slice_size, start=0):
+    """
+    Делит файл (начиная с байта start) на диапазоны байт [start, end) размером около slice_size.
+    Границы диапазонов сдвигаются до ближайшего конца строки, поэтому
+    строка никогда не разрезается между двумя диапазонами.
+    """
+    size = os.path.getsize(filepath)
+    ranges = []
+    with open(filepath, 'rb') as f:
+        while start < size:
+            end = start + slice_size
+            if end >= size:
+                end = size
+            else:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
 
-    return {
-        "ip": match.group('client_ip'),
-        "remote_user": match.group('user_id'),
-        "date": dt_obj.date(),
-        "time": dt_obj.time(),
-        "year": dt_obj.year,
-        "month": dt_obj.month,
-        "day": dt_obj.day,
-        "hour": dt_obj.hour,
-        "minute": dt_obj.minute,
-        "second": dt_obj.second,
-        "utc_offset": dt_obj.strftime("%z"),
-        "method": match.group('method'),
-        "path": match.group('api'),
-        "http_version": match.group('protocol'),
-        "status_code": int(match.group('status_code')),
-        "bytes_sent": int(match.group('bytes')),
-        "referrer": match.group('referrer'),
-        "user_agent": ua_string,  # оригинальная строка для справки
-        # Дополнительные поля для разбора user-agent:
-        "browser_family": user_agent.browser.family,
-        "browser_version": user_agent.browser.version_string,
-        "os_family": user_agent.os.family,
-        "os_version": user_agent.os.version_string,
-        "device_family": user_agent.device.family,
-        "is_mobile": user_agent.is_mobile,
-        "is_tablet": user_agent.is_tablet,
-        "is_pc": user_agent.is_pc,
-        "response_time": float(match.group('response_time')) if match.group('response_time') else None,
-    }
+def parse_log_bytes(data):
+    """
+    Выполняется в процессе-воркере: парсит блок строк лога (bytes).
+    Возвращает (количество прочитанных строк, порция LogBatch,
+    попадания и промахи кэша user-agent в этом воркере).
+    """
+    hits, misses = user_agent_cache.hits, user_agent_cache.misses
+    lines = data.decode('utf-8').split('\n')
+    if lines and not lines[-1]:
+        lines.pop()
+    batch = parse_batch([line.rstrip('\r') for line in lines], NEW_LOG_PATTERN, timestamp_parser,
+                        parse_user_agent_details)
+    return len(lines), batch, user_agent_cache.hits - hits, user_agent_cache.misses - misses
 
-def batch_query(model, field_name, values, batch_size=500):
+def parse_file_range(filepath, start, end):
     """
-    Выполняет пакетный запрос в БД для модели model с фильтрацией по полю field_name из списка values.
-    Возвращает словарь {значение: id объекта}
+    Выполняется в процессе-воркере: читает диапазон байт несжатого файла и парсит его строки.
     """
-    results = {}
-    values = list(values)
-    for i in range(0, len(values), batch_size):
-        chunk = values[i:i+batch_size]
-        qs = model.objects.filter(**{f"{field_name}__in": chunk})
-        for obj in qs:
-            results[getattr(obj, field_name)] = obj.id
-    return results
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return parse_log_bytes(data)
 
 class Command(BaseCommand):
     help = "Загрузка лог-файлов с полным набором полей из лога, с нормализацией данных user-agent."
+    # Кэши измерений на всю сессию загрузки (создаются в handle или при первой записи)
+    dimensions = None
+    # Вставка FactLog через executemany вместо bulk_create (--bulk_mode)
+    raw_insert = False
+    # Вести дневные агрегаты при записи (--inline_aggregates)
+    inline_aggregates = False
+    rows_written = 0
 
     def add_arguments(self, parser):
-        parser.add_argument('--logdir', type=str, default='logs', help='Путь к каталогу с .log файлами')
+        parser.add_argument('--logdir', type=str, default='logs',
+                            help='Путь к каталогу с .log файлами (а также .gz, .bz2, .xz)')
         parser.add_argument('--chunk_size', type=int, default=10000, help='Количество строк для обработки за один раз')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Количество процессов для парсинга (1 - парсинг в текущем процессе)')
+        parser.add_argument('--slice_size', type=int, default=8 * 1024 * 1024,
+                            help='Размер (в байтах) куска файла, который парсит один воркер')
+        parser.add_argument('--ua_cache_size', type=int, default=10000,
+                            help='Максимальное количество разобранных user-agent в кэше')
+        parser.add_argument('--dim_cache_size', type=int, default=200000,
+                            help='Максимальное количество ключей в кэше каждого измерения')
+        parser.add_argument('--follow', action='store_true',
+                            help='Следить за растущими .log файлами каталога и загружать новые строки')
+        parser.add_argument('--from_end', action='store_true',
+                            help='В режиме --follow начинать с конца уже существующих файлов')
+        parser.add_argument('--flush_lines', type=int, default=5000,
+                            help='В режиме --follow: записывать порцию при накоплении стольких строк')
+        parser.add_argument('--flush_interval', type=float, default=2.0,
+                            help='В режиме --follow: записывать порцию не позже, чем через столько секунд')
+        parser.add_argument('--poll_interval', type=float, default=0.5,
+                            help='В режиме --follow: пауза между проверками файлов, если новых строк нет')
+        parser.add_argument('--bulk_mode', action='store_true',
+                            help='Массовая загрузка в SQLite: WAL, synchronous=NORMAL и вставка FactLog '
+                                 'через executemany без создания экземпляров модели')
+        parser.add_argument('--inline_aggregates', action='store_true',
+                            help='Обновлять IpDateAggregate и DateStatusAggregate в транзакции каждой '
+                                 'порции (отдельный запуск aggregate_logs не нужен)')
+        parser.add_argument('--defer_indexes', action='store_true',
+                            help='В режиме --bulk_mode: удалить вторичные индексы FactLog на время '
+                                 'загрузки и построить их заново в конце')
 
     def handle(self, *args, **options):
         logdir = options['logdir']
         chunk_size = options['chunk_size']
+        workers = options['workers']
         if not os.path.isdir(logdir):
             raise CommandError(f"Каталог {logdir} не найден.")
-        files = [os.path.join(logdir, f) for f in os.listdir(logdir) if f.endswith('.log')]
+        if workers < 1:
+            raise CommandError("--workers должен быть не меньше 1.")
+        bulk_mode = options['bulk_mode']
+        if bulk_mode and connection.vendor != 'sqlite':
+            raise CommandError("--bulk_mode поддерживается только для SQLite.")
+        if options['defer_indexes'] and (not bulk_mode or options['follow']):
+            raise CommandError("--defer_indexes используется только с --bulk_mode и без --follow.")
+        user_agent_cache.maxsize = options['ua_cache_size']
+        self.dimensions = DimensionCaches(maxsize=options['dim_cache_size'])
+        warmed = warm_user_agent_cache()
+        self.stdout.write(f"В кэш загружено {warmed} user-agent из БД.")
+        self.ua_hits = self.ua_misses = 0
+        self.raw_insert = bulk_mode
+        self.inline_aggregates = options['inline_aggregates']
+        self.rows_written = 0
+
+        started = time.perf_counter()
+        with sqlite_bulk_load(options['defer_indexes']) if bulk_mode else nullcontext():
+            self.load(logdir, chunk_size, workers, options)
+        elapsed = time.perf_counter() - started
+        if self.rows_written:
+            self.stdout.write(f"Записано {self.rows_written} строк FactLog за {elapsed:.1f} с "
+                              f"({self.rows_written / elapsed:,.0f} строк/с, "
+                              f"{'executemany (--bulk_mode)' if bulk_mode else 'ORM bulk_create'}).")
+
+    def load(self, logdir, chunk_size, workers, options):
+        if options['follow']:
+            self.handle_follow(logdir, options['flush_lines'], options['flush_interval'],
+                               options['poll_interval'], options['from_end'])
+            return
+        files = [os.path.join(logdir, f) for f in os.listdir(logdir) if is_log_file(f)]
         if not files:
-            self.stdout.write("Нет .log файлов в каталоге.")
+            self.stdout.write("Нет .log файлов (или сжатых .gz, .bz2, .xz) в каталоге.")
+            return
+        if workers > 1:
+            self.handle_parallel(files, chunk_size, workers, options['slice_size'])
+            self.report_user_agent_cache()
+            self.stdout.write(self.style.SUCCESS("Все лог-файлы успешно обработаны."))
             return
+        hits, misses = user_agent_cache.hits, user_agent_cache.misses
         total_parsed = 0
+
+        def progress(lines_count):
+            nonlocal total_parsed
+            total_parsed += lines_count
+            self.stdout.write(f"Обработано {total_parsed} строк.")
+
         for filepath in files:
-            basename = os.path.basename(filepath)
-            # Определяем сервер по имени файла: если в имени есть "logfiles", значит это Server B, иначе Server A.
-            server = "Server B" if "logfiles" in basename.lower() else "Server A"
-            self.stdout.write(f"Обрабатываю файл: {filepath} (Server: {server})")
-            with open(filepath, 'r', encoding='utf-8') as f:
-                chunk_lines = []
-                for line in f:
-                    chunk_lines.append(line)
-                    if len(chunk_lines) >= chunk_size:
-                        self.process_chunk(chunk_lines, server)
-                        total_parsed += len(chunk_lines)
-                        self.stdout.write(f"Обработано {total_parsed} строк.")
-                        chunk_lines = []
-                if chunk_lines:
-                    self.process_chunk(chunk_lines, server)
-                    total_parsed += len(chunk_lines)
-                    self.stdout.write(f"Обработано {total_parsed} строк.")
+            self.stdout.write(f"Обрабатываю файл: {filepath} (Server: {server_for_file(filepath)})")
+            ingest_file(filepath, self.process_chunk, chunk_size=chunk_size,
+                        log=self.stdout.write, progress=progress)
+        self.ua_hits = user_agent_cache.hits - hits
+        self.ua_misses = user_agent_cache.misses - misses
+        self.report_user_agent_cache()
         self.stdout.write(self.style.SUCCESS("Все лог-файлы успешно обработаны."))
 
-    @transaction.atomic
-    def process_chunk(self, lines, server):
-        parsed = []
-        for line in lines:
-            data = parse_log_line(line)
-            if data:
-                parsed.append(data)
-        if not parsed:
-            return
+    def report_user_agent_cache(self):
+        lookups = self.ua_hits + self.ua_misses
+        hit_rate = self.ua_hits / lookups * 100 if lookups else 0
+        self.stdout.write(f"Кэш user-agent: попаданий {self.ua_hits}, промахов {self.ua_misses} "
+                          f"({hit_rate:.1f}% попаданий).")
 
-        # 1. Обработка IP-адресов
-        ips = {p["ip"] for p in parsed}
-        existing_ips = batch_query(DimIP, "ip_address", ips, batch_size=500)
-        new_ips = [DimIP(ip_address=ip) for ip in ips if ip not in existing_ips]
-        if new_ips:
-            DimIP.objects.bulk_create(new_ips)
-            new_ip_ids = batch_query(DimIP, "ip_address", {ip for ip in ips if ip not in existing_ips}, batch_size=500)
-            existing_ips.update(new_ip_ids)
+    def handle_parallel(self, files, chunk_size, workers, slice_size):
+        """
+        Парсинг в пуле процессов: каждый файл делится на диапазоны байт по границам строк,
+        воркеры парсят диапазоны, а запись в БД (измерения и FactLog) выполняет
+        только текущий процесс, сохраняя порядок диапазонов.
+        Каждый диапазон фиксируется в одной транзакции с журналом IngestedFile,
+        номер поколения увеличивается вместе с последним диапазоном файла.
+        """
+        entries = []
+        for filepath in files:
+            entry = get_ledger_entry(filepath)
+            if entry.completed:
+                self.stdout.write(f"Файл {filepath} уже загружен ({entry.line_count} строк), пропускаю.")
+            else:
+                entries.append((filepath, entry))
 
-        # 2. Обработка даты и времени
-        dt_keys = {
-            (p["date"], p["time"], p["utc_offset"], p["year"], p["month"], p["day"], p["hour"], p["minute"], p["second"])
-            for p in parsed
-        }
-        existing_dt = {}
-        for dt in DimDateTime.objects.all().values("id", "log_date", "log_time", "utc_offset",
-                                                     "year", "month", "day", "hour", "minute", "second"):
-            key = (dt["log_date"], dt["log_time"], dt["utc_offset"], dt["year"], dt["month"],
-                   dt["day"], dt["hour"], dt["minute"], dt["second"])
-            existing_dt[key] = dt["id"]
-        new_dt = []
-        for key in dt_keys:
-            if key not in existing_dt:
-                (log_date, log_time, utc_offset, year, month, day, hour, minute, second) = key
-                new_dt.append(DimDateTime(
-                    log_date=log_date,
-                    log_time=log_time,
-                    utc_offset=utc_offset,
-                    year=year,
-                    month=month,
-                    day=day,
-                    hour=hour,
-                    minute=minute,
-                    second=second,
-                ))
-        if new_dt:
-            DimDateTime.objects.bulk_create(new_dt)
-            for dt in DimDateTime.objects.all().values("id", "log_date", "log_time", "utc_offset",
-                                                        "year", "month", "day", "hour", "minute", "second"):
-                key = (dt["log_date"], dt["log_time"], dt["utc_offset"], dt["year"], dt["month"],
-                       dt["day"], dt["hour"], dt["minute"], dt["second"])
-                existing_dt[key] = dt["id"]
+        # Соединения с БД не должны наследоваться дочерними процессами.
+        connections.close_all()
+        total_parsed = 0
+        # Ограничиваем число диапазонов "в полёте", чтобы распарсенные данные
+        # не копились в памяти быстрее, чем писатель успевает их сохранять.
+        max_pending = workers * 2
+        pending = deque()
+        task_iter = self.iter_parallel_tasks(entries, slice_size)
+        # Строки, записанные после последнего увеличения номера поколения
+        unpublished = 0
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+                def submit_next():
+                    task = next(task_iter, None)
+                    if task is not None:
+                        func, args, server, entry, end, last = task
+                        pending.append((pool.submit(func, *args), server, entry, end, last))
 
-        # 3. Обработка HTTP-запросов
-        req_keys = {(p["method"], p["path"], p["http_version"]) for p in parsed}
-        existing_req = {}
-        for req in DimRequest.objects.all().values("id", "method", "path", "http_version"):
-            key = (req["method"], req["path"], req["http_version"])
-            existing_req[key] = req["id"]
-        new_req = []
-        for key in req_keys:
-            if key not in existing_req:
-                (method, path, http_version) = key
-                new_req.append(DimRequest(method=method, path=path, http_version=http_version))
-        if new_req:
-            DimRequest.objects.bulk_create(new_req)
-            for req in DimRequest.objects.all().values("id", "method", "path", "http_version"):
-                key = (req["method"], req["path"], req["http_version"])
-                existing_req[key] = req["id"]
+                for _ in range(max_pending):
+                    submit_next()
+                while pending:
+                    future, server, entry, end, last = pending.popleft()
+                    lines_count, batch, hits, misses = future.result()
+                    self.ua_hits += hits
+                    self.ua_misses += misses
+                    submit_next()
+                    with transaction.atomic():
+                        for i in range(0, len(batch), chunk_size):
+                            self.store_batch(batch.slice(i, i + chunk_size), server)
+                        entry.offset = end
+                        entry.line_count += lines_count
+                        entry.completed = last
+                        entry.save(update_fields=['offset', 'line_count', 'completed', 'updated_at'])
+                        if last:
+                            bump_generation()
+                    unpublished = 0 if last else unpublished + lines_count
+                    total_parsed += lines_count
+                    self.stdout.write(f"Обработано {total_parsed} строк.")
+        finally:
+            if unpublished:
+                bump_generation()
+
+    def iter_parallel_tasks(self, entries, slice_size):
+        """
+        Генерирует задания для пула: (функция, аргументы, сервер, запись журнала,
+        смещение после задания, последнее ли это задание файла).
+        Несжатые файлы делятся на диапазоны байт, которые воркер читает сам;
+        сжатые распаковываются потоково в этом процессе и отдаются воркерам
+        блоками целых строк.
+        """
+        for filepath, entry in entries:
+            server = server_for_file(filepath)
+            self.stdout.write(f"Обрабатываю файл: {filepath} (Server: {server}, с байта {entry.offset})")
+            if detect_compression(filepath) is None:
+                ranges = split_file_ranges(filepath, slice_size, start=entry.offset)
+                for start, end in ranges:
+                    yield parse_file_range, (filepath, start, end), server, entry, end, end >= entry.size
+                if ranges:
+                    continue
+            else:
+                with open_log_file(filepath) as f:
+                    f.seek(entry.offset)
+                    offset = entry.offset
+                    block = None
+                    for next_block in read_line_blocks(f, slice_size):
+                        if block is not None:
+                            yield parse_log_bytes, (block,), server, entry, offset, False
+                        block = next_block
+                        offset += len(block)
+                if block is not None:
+                    yield parse_log_bytes, (block,), server, entry, offset, True
+                    continue
+            # Читать нечего - файл уже загружен целиком
+            entry.completed = True
+            entry.save(update_fields=['completed', 'updated_at'])
+
+    def handle_follow(self, logdir, flush_lines, flush_interval, poll_interval, start_at_end):
+        """
+        Режим --follow: дочитывает растущие файлы каталога (с учётом ротации) и
+        записывает новые строки микро-порциями - как только накопилось flush_lines
+        строк или самая старая ожидающая строка ждёт дольше flush_interval секунд.
+        Чтение продолжается со смещений журнала IngestedFile, и каждая порция
+        фиксируется в одной транзакции с его обновлением, поэтому перезапуск или
+        слежение после пакетной загрузки не создают дубликатов. --from_end
+        действует только на файлы, которых ещё нет в журнале.
+        Останавливается по Ctrl+C, записав всё накопленное.
+        """
+        def open_file(path, at_end):
+            entry = get_ledger_entry(path)
+            if at_end and not entry.offset and not entry.line_count:
+                # Новый файл: уже записанное в него пропускаем
+                entry.offset = entry.size
+                entry.save(update_fields=['offset', 'updated_at'])
+            followed = FollowedFile(path, offset=entry.offset)
+            followed.entry = entry
+            return followed
+
+        follower = LogFollower(logdir, start_at_end=start_at_end, open_file=open_file)
+        batches = defaultdict(list)
+        # Файлы с ожидающими строками: FollowedFile -> число строк
+        pending_files = {}
+        pending = 0
+        first_pending_at = None
+        total_parsed = 0
+
+        def flush():
+            nonlocal pending, first_pending_at, total_parsed
+            with transaction.atomic():
+                for server, lines in batches.items():
+                    self.process_chunk(lines, server)
+                for followed, lines_count in pending_files.items():
+                    advance_ledger_entry(followed.entry, followed.file, followed.line_offset, lines_count)
+                # Кэши дашборда сбрасываются раз в порцию слежения (не чаще flush_interval)
+                bump_generation()
+            batches.clear()
+            pending_files.clear()
+            total_parsed += pending
+            self.stdout.write(f"Обработано {total_parsed} строк.")
+            pending = 0
+            first_pending_at = None
 
-        # 4. Обработка данных user-agent через DimUserAgent
-        ua_details = {}
-        for p in parsed:
-            ua_str = p["user_agent"]
-            if ua_str not in ua_details:
-                ua_details[ua_str] = {
-                    "browser_family": p.get("browser_family", ""),
-                    "browser_version": p.get("browser_version", ""),
-                    "os_family": p.get("os_family", ""),
-                    "os_version": p.get("os_version", ""),
-                    "device_family": p.get("device_family", ""),
-                    "is_mobile": p.get("is_mobile", False),
-                    "is_tablet": p.get("is_tablet", False),
-                    "is_pc": p.get("is_pc", False),
-                }
-        uas = set(ua_details.keys())
-        existing_uas = {}
-        for ua in DimUserAgent.objects.filter(original_user_agent__in=uas).values("id", "original_user_agent"):
-            existing_uas[ua["original_user_agent"]] = ua["id"]
-        new_uas = []
-        for ua_str, details in ua_details.items():
-            if ua_str not in existing_uas:
-                new_uas.append(DimUserAgent(
-                    original_user_agent=ua_str,
-                    browser_family=details["browser_family"],
-                    browser_version=details["browser_version"],
-                    os_family=details["os_family"],
-                    os_version=details["os_version"],
-                    device_family=details["device_family"],
-                    is_mobile=details["is_mobile"],
-                    is_tablet=details["is_tablet"],
-                    is_pc=details["is_pc"],
-                ))
-        if new_uas:
-            DimUserAgent.objects.bulk_create(new_uas)
-            for ua in DimUserAgent.objects.filter(original_user_agent__in=uas).values("id", "original_user_agent"):
-                existing_uas[ua["original_user_agent"]] = ua["id"]
+        self.stdout.write(f"Слежу за каталогом {logdir} (Ctrl+C для остановки).")
+        try:
+            while True:
+                new_lines = follower.poll()
+                for followed, lines in new_lines:
+                    batches[server_for_file(followed.path)].extend(lines)
+                    pending_files[followed] = pending_files.get(followed, 0) + len(lines)
+                    if first_pending_at is None:
+                        first_pending_at = time.monotonic()
+                    pending += len(lines)
+                # Заменённый файл закроется при следующем poll() - его строки записываем сразу
+                retired = any(follower.files.get(followed.path) is not followed for followed in pending_files)
+                if pending and (pending >= flush_lines or retired
+                                or time.monotonic() - first_pending_at >= flush_interval):
+                    flush()
+                if not new_lines:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            if pending:
+                flush()
+            self.stdout.write(self.style.SUCCESS("Слежение остановлено."))
+        finally:
+            follower.close()
+
+    def process_chunk(self, lines, server):
+        self.store_batch(parse_batch(lines, NEW_LOG_PATTERN, timestamp_parser, parse_user_agent_details), server)
 
-        # 5. Создание записей FactLog с учетом ссылки на DimUserAgent
-        fact_objects = []
-        for p in parsed:
-            ip_id = existing_ips[p["ip"]]
-            dt_key = (p["date"], p["time"], p["utc_offset"], p["year"], p["month"], p["day"], p["hour"], p["minute"], p["second"])
-            dt_id = existing_dt[dt_key]
-            req_key = (p["method"], p["path"], p["http_version"])
-            req_id = existing_req[req_key]
-            ua_id = existing_uas.get(p["user_agent"])
-            fact_objects.append(FactLog(
-                ip_id=ip_id,
-                datetime_entry_id=dt_id,
-                request_id=req_id,
-                status_code=p["status_code"],
-                bytes_sent=p["bytes_sent"],
-                referrer=p["referrer"],
-                user_agent=p["user_agent"],  # Оригинальная строка для справки
-                user_agent_detail_id=ua_id,    # Ссылка на запись в DimUserAgent
-                remote_user=p["remote_user"],
-                response_time=p["response_time"],
-                server=server
-            ))
-        if fact_objects:
-            FactLog.objects.bulk_create(fact_objects, batch_size=5000)
+    def store_batch(self, batch, server):
+        """
+        Сохраняет уже распарсенную порцию (LogBatch): разрешает измерения и создаёт записи FactLog.
+        """
+        if self.dimensions is None:
+            self.dimensions = DimensionCaches()
+        self.rows_written += store_batch(batch, server, self.dimensions, raw_insert=self.raw_insert,
+                                         inline_aggregates=self.inline_aggregates)
 
 # Функция-обёртка для обработки одного файла логов
 def process_log_file(file_path):
     """
-    Обрабатывает один файл логов, читая все строки и вызывая метод process_chunk.
+    Обрабатывает один файл логов порциями через метод process_chunk
+    с учётом журнала загрузки (см. ingest_file).
     """
     command = Command()
-    basename = os.path.basename(file_path)
-    server = "Server B" if "logfiles" in basename.lower() else "Server A"
-    with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    command.process_chunk(lines, server)
+    ingest_file(file_path, command.process_chunk)
 
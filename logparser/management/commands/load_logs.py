@@ -1,9 +1,10 @@
 import os
 import re
-import datetime
+import threading
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
-from logparser.models import DimIP, DimDateTime, DimRequest, FactLog
+from logparser.columnar import parse_batch
+from logparser.ingest import DimensionCaches, ingest_file, ingest_stream, store_batch
+from logparser.parse_utils import TimestampParser
 
 NEW_LOG_PATTERN = re.compile(
     r'^(?P<client_ip>\S+)\s+'
@@ -18,30 +19,39 @@ NEW_LOG_PATTERN = re.compile(
     r'(?P<response_time>\d+)$'
 )
 
-def parse_datetime(dt_str):
-    dt_format = "%Y-%m-%d %H:%M:%S %z"
-    return datetime.datetime.strptime(dt_str, dt_format)
+# Разборщик временных меток хранит кэш часовых поясов и результат разбора
+# предыдущей строки, поэтому у каждого потока (например, в пуле заданий
+# загрузки дашборда) он свой.
+_thread_state = threading.local()
+
+def get_timestamp_parser():
+    """TimestampParser текущего потока."""
+    parser = getattr(_thread_state, 'timestamp_parser', None)
+    if parser is None:
+        parser = _thread_state.timestamp_parser = TimestampParser()
+    return parser
 
 def parse_log_line(line):
     match = NEW_LOG_PATTERN.match(line)
     if not match:
         return None
     try:
-        dt_obj = parse_datetime(match.group('datetime'))
+        (log_date, log_time, year, month, day,
+         hour, minute, second, utc_offset) = get_timestamp_parser().parse_fields(match.group('datetime'))
     except ValueError:
         return None
     return {
         "ip": match.group('client_ip'),
         "remote_user": match.group('user_id'),
-        "date": dt_obj.date(),
-        "time": dt_obj.time(),
-        "year": dt_obj.year,
-        "month": dt_obj.month,
-        "day": dt_obj.day,
-        "hour": dt_obj.hour,
-        "minute": dt_obj.minute,
-        "second": dt_obj.second,
-        "utc_offset": dt_obj.strftime("%z"),
+        "date": log_date,
+        "time": log_time,
+        "year": year,
+        "month": month,
+        "day": day,
+        "hour": hour,
+        "minute": minute,
+        "second": second,
+        "utc_offset": utc_offset,
         "method": match.group('method'),
         "path": match.group('api'),
         "http_version": match.group('protocol'),
@@ -52,132 +62,53 @@ def parse_log_line(line):
         "response_time": float(match.group('response_time')) if match.group('response_time') else None,
     }
 
-def batch_query(model, field_name, values, batch_size=500):
-    results = {}
-    values = list(values)
-    for i in range(0, len(values), batch_size):
-        chunk = values[i:i+batch_size]
-        qs = model.objects.filter(**{f"{field_name}__in": chunk})
-        for obj in qs:
-            results[getattr(obj, field_name)] = obj.id
-    return results
-
 # ================================
 # Функции для загрузки лог-файла
 # ================================
 
-@transaction.atomic
-def process_chunk(lines, server):
-    parsed = []
-    for line in lines:
-        data = parse_log_line(line)
-        if data:
-            parsed.append(data)
-    if not parsed:
-        return
-
-    ips = {p["ip"] for p in parsed}
-    dt_keys = {
-        (p["date"], p["time"], p["utc_offset"], p["year"], p["month"], p["day"], p["hour"], p["minute"], p["second"])
-        for p in parsed
-    }
-    req_keys = {(p["method"], p["path"], p["http_version"]) for p in parsed}
-    existing_ips = batch_query(DimIP, "ip_address", ips, batch_size=500)
-    existing_dt = {}
-    for dt in DimDateTime.objects.all().values("id", "log_date", "log_time", "utc_offset",
-                                                 "year", "month", "day", "hour", "minute", "second"):
-        key = (dt["log_date"], dt["log_time"], dt["utc_offset"], dt["year"], dt["month"], dt["day"],
-               dt["hour"], dt["minute"], dt["second"])
-        existing_dt[key] = dt["id"]
-    existing_req = {}
-    for req in DimRequest.objects.all().values("id", "method", "path", "http_version"):
-        key = (req["method"], req["path"], req["http_version"])
-        existing_req[key] = req["id"]
-
-    new_ips = [DimIP(ip_address=ip) for ip in ips if ip not in existing_ips]
-    if new_ips:
-        DimIP.objects.bulk_create(new_ips)
-        new_ip_ids = batch_query(DimIP, "ip_address", {ip for ip in ips if ip not in existing_ips}, batch_size=500)
-        existing_ips.update(new_ip_ids)
-
-    new_dt = []
-    for key in dt_keys:
-        if key not in existing_dt:
-            (log_date, log_time, utc_offset, year, month, day, hour, minute, second) = key
-            new_dt.append(DimDateTime(
-                log_date=log_date,
-                log_time=log_time,
-                utc_offset=utc_offset,
-                year=year,
-                month=month,
-                day=day,
-                hour=hour,
-                minute=minute,
-                second=second,
-            ))
-    if new_dt:
-        DimDateTime.objects.bulk_create(new_dt)
-        for dt in DimDateTime.objects.all().values("id", "log_date", "log_time", "utc_offset",
-                                                    "year", "month", "day", "hour", "minute", "second"):
-            key = (dt["log_date"], dt["log_time"], dt["utc_offset"], dt["year"], dt["month"], dt["day"],
-                   dt["hour"], dt["minute"], dt["second"])
-            existing_dt[key] = dt["id"]
-
-    new_req = []
-    for key in req_keys:
-        if key not in existing_req:
-            (method, path, http_version) = key
-            new_req.append(DimRequest(method=method, path=path, http_version=http_version))
-    if new_req:
-        DimRequest.objects.bulk_create(new_req)
-        for req in DimRequest.objects.all().values("id", "method", "path", "http_version"):
-            key = (req["method"], req["path"], req["http_version"])
-            existing_req[key] = req["id"]
-
-    fact_objects = []
-    for p in parsed:
-        ip_id = existing_ips[p["ip"]]
-        dt_key = (p["date"], p["time"], p["utc_offset"], p["year"], p["month"], p["day"], p["hour"], p["minute"], p["second"])
-        dt_id = existing_dt[dt_key]
-        req_key = (p["method"], p["path"], p["http_version"])
-        req_id = existing_req[req_key]
-        fact_objects.append(FactLog(
-            ip_id=ip_id,
-            datetime_entry_id=dt_id,
-            request_id=req_id,
-            status_code=p["status_code"],
-            bytes_sent=p["bytes_sent"],
-            referrer=p["referrer"],
-            user_agent=p["user_agent"],
-            remote_user=p["remote_user"],
-            response_time=p["response_time"],
-            server=server
-        ))
-    if fact_objects:
-        FactLog.objects.bulk_create(fact_objects, batch_size=5000)
+def process_chunk(lines, server, dimensions=None, inline_aggregates=False):
+    """
+    Парсит порцию строк в столбцы (см. parse_batch) и сохраняет её.
+    dimensions - кэши измерений (DimensionCaches), общие для всей сессии
+    загрузки; если не переданы, создаются на одну порцию.
+    inline_aggregates - вести дневные агрегаты при записи (см. store_batch).
+    """
+    batch = parse_batch(lines, NEW_LOG_PATTERN, get_timestamp_parser())
+    if dimensions is None:
+        dimensions = DimensionCaches()
+    store_batch(batch, server, dimensions, inline_aggregates=inline_aggregates)
 
 
-def process_log_file(filepath, chunk_size=10000):
+def process_log_file(filepath, chunk_size=10000, progress=None, inline_aggregates=False):
     """
     Обрабатывает лог-файл по указанному пути: определяет сервер по имени файла и
     читает строки порциями (чанками) с последующей обработкой.
+    Уже загруженный файл пропускается, прерванная загрузка продолжается
+    с последней зафиксированной порции (см. ingest_file).
+    progress(n) вызывается после каждой сохранённой порции из n строк;
+    по умолчанию прогресс печатается.
     """
     if not os.path.isfile(filepath):
         raise Exception(f"Файл {filepath} не найден: {filepath}")
-    basename = os.path.basename(filepath)
-    # Если в имени файла встречается "logfiles" (регистр не важен) – это Server B, иначе Server A
-    server = "Server B" if "logfiles" in basename.lower() else "Server A"
     total_parsed = 0
-    with open(filepath, 'r', encoding='utf-8') as f:
-        chunk_lines = []
-        for line in f:
-            chunk_lines.append(line)
-            if len(chunk_lines) >= chunk_size:
-                process_chunk(chunk_lines, server)
-                total_parsed += len(chunk_lines)
-                print(f"Обработано {total_parsed} строк.")
-                chunk_lines = []
-        if chunk_lines:
-            process_chunk(chunk_lines, server)
-            total_parsed += len(chunk_lines)
-            print(f"Обработано {total_parsed} строк.")
+    dimensions = DimensionCaches()
+
+    def print_progress(lines_count):
+        nonlocal total_parsed
+        total_parsed += lines_count
+        print(f"Обработано {total_parsed} строк.")
+
+    ingest_file(filepath, lambda lines, server: process_chunk(lines, server, dimensions, inline_aggregates),
+                chunk_size=chunk_size, progress=progress or print_progress)
+
+
+def process_log_stream(blocks, name, chunk_size=10000, progress=None, inline_aggregates=False, fingerprint=None):
+    """
+    Обрабатывает лог, поступающий потоком байтовых блоков (например, загрузку
+    через дашборд), без записи во временный файл. Сервер определяется по имени name.
+    Уже загруженные данные пропускаются (см. ingest_stream): возвращается None.
+    """
+    dimensions = DimensionCaches()
+    return ingest_stream(blocks, name,
+                         lambda lines, server: process_chunk(lines, server, dimensions, inline_aggregates),
+                         chunk_size=chunk_size, progress=progress, fingerprint=fingerprint)
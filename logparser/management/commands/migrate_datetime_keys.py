@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from logparser.ingest import DATETIME_KEY_FIELDS, datetime_smart_key
+from logparser.models import DimDateTime, FactLog
+
+
+class Command(BaseCommand):
+    help = ("Переводит DimDateTime на вычисляемые ключи (YYYYMMDDHHMMSS + код смещения) "
+            "и перенаправляет на них ссылки FactLog.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch_size', type=int, default=5000,
+                            help='Количество записей DimDateTime, обрабатываемых за один раз')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        qn = connection.ops.quote_name
+        fact_table = qn(FactLog._meta.db_table)
+        dt_table = qn(DimDateTime._meta.db_table)
+        fk_column = qn(FactLog._meta.get_field('datetime_entry').column)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE dt_key_map (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+            remapped = 0
+            last_id = 0
+            # Новые записи получают ключи больше любого суррогатного id - их не обходим
+            max_id = DimDateTime.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+            while True:
+                rows = list(DimDateTime.objects.filter(id__gt=last_id, id__lte=max_id).order_by('id')
+                            .values('id', *DATETIME_KEY_FIELDS)[:batch_size])
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                new_objs = []
+                mapping = []
+                for row in rows:
+                    new_id = datetime_smart_key(row['year'], row['month'], row['day'], row['hour'],
+                                                row['minute'], row['second'], row['utc_offset'])
+                    if new_id == row['id']:
+                        continue
+                    mapping.append((row['id'], new_id))
+                    new_objs.append(DimDateTime(id=new_id, **{f: row[f] for f in DATETIME_KEY_FIELDS}))
+                if mapping:
+                    DimDateTime.objects.bulk_create(new_objs, batch_size=500, ignore_conflicts=True)
+                    cursor.executemany("INSERT INTO dt_key_map (old_id, new_id) VALUES (%s, %s)", mapping)
+                    remapped += len(mapping)
+                self.stdout.write(f"Подготовлено {remapped} ключей.")
+
+            cursor.execute(
+                f"UPDATE {fact_table} SET {fk_column} = "
+                f"(SELECT new_id FROM dt_key_map WHERE old_id = {fact_table}.{fk_column}) "
+                f"WHERE {fk_column} IN (SELECT old_id FROM dt_key_map)"
+            )
+            facts = cursor.rowcount
+            cursor.execute(f"DELETE FROM {dt_table} WHERE id IN (SELECT old_id FROM dt_key_map)")
+            cursor.execute("DROP TABLE dt_key_map")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено записей DimDateTime: {remapped}, обновлено записей FactLog: {facts}. "
+            f"Включите LOGPARSER_DATETIME_SMART_KEYS = True в настройках."
+        ))
@@ -22,6 +22,12 @@ class DimDateTime(models.Model):
     second = models.IntegerField()
     utc_offset = models.CharField(max_length=6)
 
+    class Meta:
+        # Поиск записей по ключу при загрузке (DimensionCache)
+        indexes = [
+            models.Index(fields=['log_date', 'log_time', 'utc_offset']),
+        ]
+
     def __str__(self):
         return f"{self.log_date} {self.log_time} ({self.utc_offset})"
 
@@ -30,6 +36,12 @@ class DimRequest(models.Model):
     path = models.CharField(max_length=255)
     http_version = models.CharField(max_length=10)
 
+    class Meta:
+        # Поиск записей по ключу при загрузке (DimensionCache)
+        indexes = [
+            models.Index(fields=['method', 'path', 'http_version']),
+        ]
+
     def __str__(self):
         return f"{self.method} {self.path}"
 
@@ -67,6 +79,69 @@ class FactLog(models.Model):
     def __str__(self):
         return f"Log #{self.id} (IP: {self.ip.ip_address})"
 
+class IngestedFile(models.Model):
+    """
+    Журнал загрузки лог-файлов: отпечаток файла (размер + хэши начала и конца),
+    смещение после последней зафиксированной порции и число загруженных строк.
+    head_hash - хэш первых head_length байт: по нему узнаётся дописанный файл.
+    Отпечаток не уникален: одинаковые пустые или короткие файлы по разным
+    путям получают отдельные записи.
+    """
+    fingerprint = models.CharField(max_length=128, db_index=True)
+    path        = models.CharField(max_length=1024)
+    size        = models.BigIntegerField()
+    head_hash   = models.CharField(max_length=40)
+    # По умолчанию - ingest.FINGERPRINT_BLOCK
+    head_length = models.BigIntegerField(default=64 * 1024)
+    offset      = models.BigIntegerField(default=0)
+    line_count  = models.BigIntegerField(default=0)
+    completed   = models.BooleanField(default=False)
+    updated_at  = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['path']),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.offset}/{self.size})"
+
+class AggregateWatermark(models.Model):
+    """
+    Отметка инкрементального пересчёта агрегатов: записи FactLog с id
+    не больше last_fact_id уже учтены в агрегатах с этим именем.
+    """
+    name         = models.CharField(max_length=50, unique=True)
+    last_fact_id = models.BigIntegerField(default=0)
+    updated_at   = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_fact_id}"
+
+class IngestGeneration(models.Model):
+    """
+    Номер поколения загруженных данных (одна строка): увеличивается в той же
+    транзакции, что и каждая сохранённая порция FactLog. Результаты,
+    закэшированные под номером поколения, устаревают вместе с ним.
+    """
+    generation = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.generation)
+
+class ServerStatusTotal(models.Model):
+    """
+    Сколько запросов каждого класса статусов (status_code // 100) на каждом сервере
+    за всё время - итоги для шапки дашборда.
+    """
+    server       = models.CharField(max_length=100, blank=True, default="")
+    status_class = models.IntegerField()
+    count        = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('server', 'status_class')
+
 class IpDateAggregate(models.Model):
     """
     Сколько запросов сделал каждый IP за каждый день.
@@ -95,4 +170,91 @@ class DateStatusAggregate(models.Model):
         indexes = [
             models.Index(fields=['log_date']),
             models.Index(fields=['status_code']),
-        ]
\ No newline at end of file
+        ]
+
+class RequestLatencySketch(models.Model):
+    """
+    Скетч квантилей времени ответа (logparser.sketches.LatencySketch)
+    по эндпоинту за день. Скетчи объединяются в скетч за любой период.
+    """
+    log_date = models.DateField()
+    request  = models.ForeignKey(DimRequest, on_delete=models.CASCADE)
+    count    = models.BigIntegerField()
+    sketch   = models.BinaryField()
+
+    class Meta:
+        unique_together = ('log_date', 'request')
+        indexes = [
+            models.Index(fields=['log_date']),
+        ]
+
+class DailyUniqueSketch(models.Model):
+    """
+    HyperLogLog (logparser.sketches.UniqueSketch) уникальных посетителей
+    за день на сервере: kind - что считается уникальным, IP или пара IP + user-agent.
+    """
+    IP = 'ip'
+    IP_USER_AGENT = 'ip_ua'
+    KIND_CHOICES = [
+        (IP, 'IP'),
+        (IP_USER_AGENT, 'IP + user-agent'),
+    ]
+
+    log_date = models.DateField()
+    server   = models.CharField(max_length=100, blank=True, default="")
+    kind     = models.CharField(max_length=5, choices=KIND_CHOICES)
+    count    = models.BigIntegerField()
+    sketch   = models.BinaryField()
+
+    class Meta:
+        unique_together = ('log_date', 'server', 'kind')
+        indexes = [
+            models.Index(fields=['kind', 'log_date']),
+        ]
+
+class DailyTopValues(models.Model):
+    """
+    Сводка Space-Saving (logparser.sketches.TopKSketch) самых частых значений
+    измерения за день: эндпоинтов (id DimRequest), IP (id DimIP) и строк user-agent.
+    """
+    ENDPOINT = 'endpoint'
+    IP = 'ip'
+    USER_AGENT = 'user_agent'
+    DIMENSION_CHOICES = [
+        (ENDPOINT, 'Эндпоинт'),
+        (IP, 'IP'),
+        (USER_AGENT, 'User-agent'),
+    ]
+
+    log_date  = models.DateField()
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    count     = models.BigIntegerField()
+    sketch    = models.BinaryField()
+
+    class Meta:
+        unique_together = ('log_date', 'dimension')
+
+class HourlyRollup(models.Model):
+    """
+    Куб почасовых агрегатов FactLog по измерениям фильтров дашборда.
+    Неизвестные браузер и ОС (загрузка без разбора user-agent) хранятся пустой строкой.
+    """
+    log_date          = models.DateField()
+    hour              = models.IntegerField()
+    server            = models.CharField(max_length=100, blank=True)
+    method            = models.CharField(max_length=10)
+    status_code       = models.IntegerField()
+    browser_family    = models.CharField(max_length=50, blank=True)
+    os_family         = models.CharField(max_length=50, blank=True)
+    count             = models.IntegerField()
+    bytes_sum         = models.BigIntegerField()
+    bytes_max         = models.BigIntegerField()
+    response_time_sum = models.FloatField(null=True)
+    response_time_min = models.FloatField(null=True)
+    response_time_max = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = ('log_date', 'hour', 'server', 'method', 'status_code', 'browser_family', 'os_family')
+        indexes = [
+            models.Index(fields=['log_date', 'hour']),
+        ]
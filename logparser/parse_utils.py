@@ -0,0 +1,294 @@
+import bz2
+import datetime
+import gzip
+import io
+import lzma
+import zlib
+from collections import OrderedDict
+from itertools import chain
+
+# Формат временной метки в логах: "2024-01-31 23:59:59 +0300"
+DT_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+
+class TimestampParser:
+    """
+    Быстрый разбор временных меток фиксированного формата DT_FORMAT.
+
+    Вместо datetime.strptime поля вырезаются по фиксированным позициям,
+    объекты timezone кэшируются по строке смещения, а результат разбора
+    переиспользуется, если подряд идут строки с одной и той же секундой
+    (для строк в пределах одной минуты разбираются только секунды).
+    Всё, что не похоже на фиксированный формат, разбирается через strptime.
+    """
+
+    def __init__(self):
+        self._tz_cache = {}
+        self._last_str = None
+        self._last_fields = None
+        self._last_minute_str = None
+        self._last_minute = None
+        self._last_suffix = None
+
+    def get_timezone(self, offset_str):
+        """Возвращает (кэшированный) объект timezone для строки вида "+0300"."""
+        tz = self._tz_cache.get(offset_str)
+        if tz is None:
+            offset_minutes = int(offset_str[3:5])
+            if offset_minutes >= 60:
+                raise ValueError(f"Некорректное смещение часового пояса: {offset_str}")
+            minutes = int(offset_str[1:3]) * 60 + offset_minutes
+            if offset_str[0] == '-':
+                minutes = -minutes
+            tz = datetime.timezone(datetime.timedelta(minutes=minutes))
+            self._tz_cache[offset_str] = tz
+        return tz
+
+    def parse(self, dt_str):
+        """Возвращает aware datetime; аналог datetime.strptime(dt_str, DT_FORMAT)."""
+        fields = self.parse_fields(dt_str)
+        offset_str = fields[8]
+        if len(offset_str) != 5:
+            # Смещение с секундами ("+030015") встречается только в нестандартных строках
+            return datetime.datetime.strptime(dt_str, DT_FORMAT)
+        return datetime.datetime.combine(fields[0], fields[1], tzinfo=self.get_timezone(offset_str))
+
+    def parse_fields(self, dt_str):
+        """
+        Возвращает кортеж (date, time, year, month, day, hour, minute, second, utc_offset),
+        где utc_offset совпадает с результатом strftime("%z").
+        При некорректной строке выбрасывает ValueError, как и strptime.
+        """
+        if dt_str == self._last_str:
+            return self._last_fields
+        if dt_str[:17] == self._last_minute_str and dt_str[19:] == self._last_suffix:
+            second_str = dt_str[17:19]
+            if second_str.isascii() and second_str.isdigit():
+                log_date, hour, minute, offset_str = self._last_minute
+                second = int(second_str)
+                fields = (log_date, datetime.time(hour, minute, second), log_date.year,
+                          log_date.month, log_date.day, hour, minute, second, offset_str)
+                self._last_str = dt_str
+                self._last_fields = fields
+                return fields
+        if (len(dt_str) == 25 and dt_str[4] == '-' and dt_str[7] == '-' and dt_str[10] == ' '
+                and dt_str[13] == ':' and dt_str[16] == ':' and dt_str[19] == ' '
+                and dt_str[20] in '+-'):
+            digits = dt_str[0:4] + dt_str[5:7] + dt_str[8:10] + dt_str[11:13] + dt_str[14:16] \
+                + dt_str[17:19] + dt_str[21:25]
+            if digits.isascii() and digits.isdigit():
+                fields = self._parse_fixed(dt_str)
+            else:
+                fields = self._parse_fallback(dt_str)
+        else:
+            fields = self._parse_fallback(dt_str)
+        self._last_str = dt_str
+        self._last_fields = fields
+        return fields
+
+    def _parse_fixed(self, dt_str):
+        log_date = datetime.date(int(dt_str[0:4]), int(dt_str[5:7]), int(dt_str[8:10]))
+        hour = int(dt_str[11:13])
+        minute = int(dt_str[14:16])
+        second = int(dt_str[17:19])
+        log_time = datetime.time(hour, minute, second)
+        offset_str = dt_str[20:25]
+        # Проверяем смещение (|offset| < 24ч), как это сделал бы strptime
+        self.get_timezone(offset_str)
+        # strftime("%z") даёт нулевое смещение как "+0000", в том числе для "-0000"
+        if offset_str == '-0000':
+            offset_str = '+0000'
+        # Следующие строки той же минуты разбираются только по секундам
+        self._last_minute_str = dt_str[:17]
+        self._last_minute = (log_date, hour, minute, offset_str)
+        self._last_suffix = dt_str[19:]
+        return (log_date, log_time, log_date.year, log_date.month, log_date.day,
+                hour, minute, second, offset_str)
+
+    def _parse_fallback(self, dt_str):
+        dt_obj = datetime.datetime.strptime(dt_str, DT_FORMAT)
+        return (dt_obj.date(), dt_obj.time(), dt_obj.year, dt_obj.month, dt_obj.day,
+                dt_obj.hour, dt_obj.minute, dt_obj.second, dt_obj.strftime("%z"))
+
+
+class LRUCache:
+    """
+    Простой LRU-кэш ограниченного размера со счётчиками попаданий и промахов.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+# Расширения файлов, которые загрузчик берёт из каталога с логами
+LOG_FILE_SUFFIXES = ('.log', '.gz', '.bz2', '.xz')
+# Размер блока при чтении лог-файлов (в том числе сжатых)
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Сигнатуры сжатых форматов -> функция открытия потока на чтение
+COMPRESSED_OPENERS = (
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+)
+
+
+def is_log_file(filename):
+    return filename.endswith(LOG_FILE_SUFFIXES)
+
+
+def detect_compression(filepath):
+    """Возвращает функцию открытия сжатого файла по его сигнатуре или None для обычного файла."""
+    with open(filepath, 'rb') as f:
+        magic = f.read(6)
+    for signature, opener in COMPRESSED_OPENERS:
+        if magic.startswith(signature):
+            return opener
+    return None
+
+
+def open_log_file(filepath):
+    """
+    Открывает лог-файл на чтение как бинарный поток. Сжатые gzip/bz2/xz файлы
+    (определяются по сигнатуре, а не по расширению) распаковываются на лету.
+    """
+    opener = detect_compression(filepath)
+    if opener is None:
+        return open(filepath, 'rb', buffering=READ_BLOCK_SIZE)
+    return io.BufferedReader(opener(filepath, 'rb'), buffer_size=READ_BLOCK_SIZE)
+
+
+def read_line_blocks(f, block_size=READ_BLOCK_SIZE):
+    """
+    Читает бинарный поток f крупными блоками около block_size байт;
+    каждый блок (кроме, возможно, последнего) заканчивается переводом строки.
+    """
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return
+        if not block.endswith(b'\n'):
+            block += f.readline()
+        yield block
+
+
+def read_line_chunks(f, chunk_size, offset=0):
+    """
+    Читает бинарный поток f крупными блоками и отдаёт порции по chunk_size строк
+    вместе со смещением (в байтах от начала файла, для сжатых - от начала
+    распакованных данных) сразу за последней строкой порции.
+    offset - позиция, с которой начинается чтение f.
+    """
+    lines = []
+    for block in read_line_blocks(f):
+        parts = block.split(b'\n')
+        tail = parts.pop()
+        for raw in parts:
+            offset += len(raw) + 1
+            lines.append(raw.decode('utf-8').rstrip('\r'))
+            if len(lines) >= chunk_size:
+                yield lines, offset
+                lines = []
+        if tail:
+            # Последняя строка файла без перевода строки
+            offset += len(tail)
+            lines.append(tail.decode('utf-8').rstrip('\r'))
+    if lines:
+        yield lines, offset
+
+
+# Потоковые распаковщики для данных без файла (например, загрузок через дашборд)
+STREAM_DECOMPRESSORS = (
+    (b'\x1f\x8b', lambda: zlib.decompressobj(wbits=31)),
+    (b'BZh', bz2.BZ2Decompressor),
+    (b'\xfd7zXZ\x00', lzma.LZMADecompressor),
+)
+
+
+def decompress_blocks(blocks):
+    """
+    Распаковывает поток байтовых блоков на лету, если первый блок начинается
+    с сигнатуры gzip/bz2/xz; иначе отдаёт блоки как есть.
+    Склеенные сжатые потоки (несколько gzip-членов подряд) распаковываются целиком.
+    """
+    blocks = iter(blocks)
+    first = next(blocks, b'')
+    factory = next((factory for signature, factory in STREAM_DECOMPRESSORS
+                    if first.startswith(signature)), None)
+    if factory is None:
+        yield first
+        yield from blocks
+        return
+    decompressor = factory()
+    for block in chain([first], blocks):
+        while block:
+            yield decompressor.decompress(block)
+            if decompressor.eof:
+                block = decompressor.unused_data
+                decompressor = factory()
+            else:
+                block = b''
+
+
+def split_line_blocks(blocks, chunk_size, offset=0):
+    """
+    Собирает строки из потока байтовых блоков произвольной длины (строка может
+    быть разрезана между блоками) и отдаёт их порциями по chunk_size строк
+    вместе со смещением сразу за последней строкой порции (как read_line_chunks).
+    offset - позиция в данных, с которой начинается поток.
+    """
+    lines = []
+    tail = b''
+    for block in blocks:
+        parts = (tail + block).split(b'\n') if tail else block.split(b'\n')
+        tail = parts.pop()
+        for raw in parts:
+            offset += len(raw) + 1
+            lines.append(raw.decode('utf-8').rstrip('\r'))
+            if len(lines) >= chunk_size:
+                yield lines, offset
+                lines = []
+    if tail:
+        # Последняя строка без перевода строки
+        offset += len(tail)
+        lines.append(tail.decode('utf-8').rstrip('\r'))
+    if lines:
+        yield lines, offset
+
+
+def skip_bytes(blocks, count):
+    """Отдаёт поток байтовых блоков без первых count байт."""
+    for block in blocks:
+        if count >= len(block):
+            count -= len(block)
+            continue
+        yield block[count:] if count else block
+        count = 0
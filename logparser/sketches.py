@@ -0,0 +1,256 @@
+"""
+Компактные объединяемые скетчи для приблизительных статистик по логам.
+"""
+import hashlib
+import heapq
+import json
+import math
+import struct
+import zlib
+from collections import Counter
+
+import numpy as np
+
+# Относительная ошибка квантилей времени ответа
+LATENCY_RELATIVE_ACCURACY = 0.01
+
+
+class LatencySketch:
+    """
+    Логарифмическая гистограмма (по схеме DDSketch) для квантилей времени ответа.
+
+    Значение x > 0 попадает в корзину i = ceil(log_gamma(x)), где
+    gamma = (1 + a) / (1 - a); оценка значения корзины 2 * gamma^i / (gamma + 1)
+    отличается от любого попавшего в неё значения не больше чем на долю a.
+    Нули (и отрицательные значения) считаются отдельно. Скетчи с одинаковой
+    точностью объединяются сложением счётчиков корзин, поэтому скетчи за дни
+    и по эндпоинтам можно сливать в скетч за любой период.
+    """
+
+    HEADER = struct.Struct('<dQqI')
+
+    def __init__(self, relative_accuracy=LATENCY_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.bins.values())
+
+    def add_many(self, values):
+        """Добавляет значения (итерируемое чисел; None и NaN пропускаются)."""
+        array = np.array([v for v in values if v is not None], dtype=np.float64)
+        array = array[~np.isnan(array)]
+        positive = array[array > 0]
+        self.zero_count += int(array.size - positive.size)
+        if not positive.size:
+            return
+        indexes, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64),
+                                    return_counts=True)
+        bins = self.bins
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            bins[index] = bins.get(index, 0) + count
+
+    def merge(self, other):
+        """Прибавляет к скетчу счётчики другого скетча той же точности."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Нельзя объединить скетчи с разной точностью.")
+        self.zero_count += other.zero_count
+        bins = self.bins
+        for index, count in other.bins.items():
+            bins[index] = bins.get(index, 0) + count
+        return self
+
+    def quantile(self, q):
+        """Оценка q-квантиля (0 <= q <= 1); None для пустого скетча."""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_bytes(self):
+        """Сериализация: заголовок и плотный массив счётчиков от минимальной до максимальной корзины."""
+        if self.bins:
+            first = min(self.bins)
+            dense = np.zeros(max(self.bins) - first + 1, dtype='<u8')
+            for index, count in self.bins.items():
+                dense[index - first] = count
+        else:
+            first = 0
+            dense = np.zeros(0, dtype='<u8')
+        header = self.HEADER.pack(self.relative_accuracy, self.zero_count, first, dense.size)
+        return zlib.compress(header + dense.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = zlib.decompress(bytes(data))
+        relative_accuracy, zero_count, first, size = cls.HEADER.unpack_from(data)
+        sketch = cls(relative_accuracy)
+        sketch.zero_count = zero_count
+        dense = np.frombuffer(data, dtype='<u8', count=size, offset=cls.HEADER.size)
+        for offset in np.flatnonzero(dense).tolist():
+            sketch.bins[first + offset] = int(dense[offset])
+        return sketch
+
+
+# Точность HyperLogLog: 2^14 регистров, стандартная ошибка 1.04 / sqrt(2^14) ~ 0.8%
+UNIQUE_PRECISION = 14
+
+
+class UniqueSketch:
+    """
+    HyperLogLog для оценки числа уникальных значений (IP, IP + user-agent).
+
+    Значение хэшируется blake2b в 64 бита: старшие precision бит выбирают
+    регистр, в регистре хранится максимальный номер первой единицы в
+    остальных битах. Скетчи с одинаковой точностью объединяются поэлементным
+    максимумом регистров - оценка для объединения множеств (дней, серверов)
+    получается без обращения к исходным данным.
+    """
+
+    def __init__(self, precision=UNIQUE_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @staticmethod
+    def hash_values(values):
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'little')
+             for value in values),
+            dtype=np.uint64,
+        )
+
+    def add_many(self, values):
+        """Добавляет строки values (повторы в порции хэшируются один раз)."""
+        hashes = self.hash_values(set(values))
+        if not hashes.size:
+            return
+        rest_bits = 64 - self.precision
+        indexes = (hashes >> np.uint64(rest_bits)).astype(np.intp)
+        # Остаток меньше 2^53 и точно представим во float64: frexp даёт номер старшего бита без ошибок округления
+        _, exponents = np.frexp((hashes & np.uint64((1 << rest_bits) - 1)).astype(np.float64))
+        ranks = (rest_bits + 1 - exponents).astype(np.uint8)
+        np.maximum.at(self.registers, indexes, ranks)
+
+    def merge(self, other):
+        """Объединяет скетч с другим скетчем той же точности."""
+        if other.precision != self.precision:
+            raise ValueError("Нельзя объединить скетчи с разной точностью.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def count(self):
+        """Оценка числа уникальных значений (для малых значений - линейный подсчёт)."""
+        m = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return zlib.compress(bytes([self.precision]) + self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = zlib.decompress(bytes(data))
+        sketch = cls(data[0])
+        sketch.registers = np.frombuffer(data, dtype=np.uint8, offset=1).copy()
+        return sketch
+
+
+# Сколько счётчиков хранит сводка Space-Saving
+TOP_CAPACITY = 200
+
+
+class TopKSketch:
+    """
+    Сводка Space-Saving для самых частых значений (эндпоинты, IP, user-agent).
+
+    Хранится не больше capacity счётчиков {значение: [оценка, ошибка]}.
+    Сводки (и точные частоты порции) объединяются сложением оценок; значению,
+    которого нет в заполненной сводке, прибавляется её минимальная оценка.
+    После объединения остаются capacity наибольших оценок. Оценка не меньше
+    истинной частоты и превышает её не больше чем на ошибку; любое значение
+    с частотой больше total / capacity в сводке есть.
+    """
+
+    def __init__(self, capacity=TOP_CAPACITY):
+        self.capacity = capacity
+        self.counters = {}
+        self.total = 0
+
+    @property
+    def count(self):
+        return self.total
+
+    def floor(self):
+        """Верхняя граница частоты значения, которого нет в сводке."""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def add_many(self, values):
+        """Добавляет значения: точные частоты порции объединяются со сводкой как сводка без ошибок."""
+        counts = Counter(values)
+        self.merge_counters({value: (count, 0) for value, count in counts.items()}, 0, sum(counts.values()))
+
+    def merge(self, other):
+        """Объединяет сводку с другой сводкой той же ёмкости."""
+        return self.merge_counters(other.counters, other.floor(), other.total)
+
+    def merge_counters(self, counters, floor, total):
+        """
+        Складывает оценки со счётчиками другой сводки (floor - её оценка для
+        отсутствующих значений) и оставляет capacity наибольших оценок.
+        Отброшенные значения не превышают минимальную оставшуюся оценку,
+        поэтому floor() остаётся верхней границей для значений вне сводки.
+        """
+        own_floor = self.floor()
+        merged = {}
+        for value in self.counters.keys() | counters.keys():
+            count, error = self.counters.get(value, (own_floor, own_floor))
+            other_count, other_error = counters.get(value, (floor, floor))
+            merged[value] = [count + other_count, error + other_error]
+        if len(merged) > self.capacity:
+            merged = dict(heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0]))
+        self.counters = merged
+        self.total += total
+        return self
+
+    def top(self, limit):
+        """
+        Кандидаты в limit самых частых значений: все значения, оценка которых
+        не меньше limit-й по величине гарантированной частоты (оценка - ошибка).
+        """
+        guaranteed = sorted((count - error for count, error in self.counters.values()), reverse=True)
+        if len(guaranteed) <= limit:
+            return list(self.counters)
+        threshold = guaranteed[limit - 1]
+        return [value for value, (count, _) in self.counters.items() if count >= threshold]
+
+    def to_bytes(self):
+        data = {"capacity": self.capacity, "total": self.total,
+                "counters": [[value, count, error] for value, (count, error) in self.counters.items()]}
+        return zlib.compress(json.dumps(data).encode())
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = json.loads(zlib.decompress(bytes(data)))
+        sketch = cls(data["capacity"])
+        sketch.total = data["total"]
+        sketch.counters = {value: [count, error] for value, count, error in data["counters"]}
+        return sketch
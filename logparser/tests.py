@@ -1,3 +1,401 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import math
+import os
+import random
+import tempfile
+import threading
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from logparser.aggregates import current_generation, unique_count
+from logparser.ingest import (
+    FINGERPRINT_BLOCK, advance_ledger_entry, file_fingerprint, get_ledger_entry, ingest_file, ingest_stream,
+)
+from logparser.management.commands.load_logs import get_timestamp_parser
+from logparser.models import DimDateTime, DimIP, DimRequest, FactLog, IngestedFile
+from logparser.parse_utils import (
+    DT_FORMAT, TimestampParser, read_line_blocks, read_line_chunks, skip_bytes, split_line_blocks,
+)
+from logparser.sketches import LatencySketch, UniqueSketch
+
+
+def strptime_fields(dt_str):
+    dt_obj = datetime.datetime.strptime(dt_str, DT_FORMAT)
+    return (dt_obj.date(), dt_obj.time(), dt_obj.year, dt_obj.month, dt_obj.day,
+            dt_obj.hour, dt_obj.minute, dt_obj.second, dt_obj.strftime("%z"))
+
+
+class TimestampParserTests(SimpleTestCase):
+    """TimestampParser должен давать те же поля, что и datetime.strptime."""
+
+    VALID = [
+        "2024-01-31 23:59:59 +0300",
+        "2024-02-29 00:00:00 -0530",
+        "1999-12-31 12:34:56 +0000",
+        "2024-01-01 00:00:03 -0000",
+        "2024-06-15 08:09:10 +1400",
+        # Нестандартные, но допустимые для strptime строки - через запасной путь
+        "2024-1-5 7:08:09 +0300",
+        "2024-01-05 07:08:09 +03:00",
+    ]
+    INVALID = [
+        "",
+        "not a timestamp",
+        "2024-13-01 00:00:00 +0300",
+        "2023-02-29 00:00:00 +0300",
+        "2024-01-01 24:00:00 +0300",
+        "2024-01-01 00:60:00 +0300",
+        "2024-01-01 00:00:00 +0360",
+        "2024-01-01 00:00:00 0300",
+        "2024-01-01 00:00:0x +0300",
+    ]
+
+    def test_matches_strptime(self):
+        for dt_str in self.VALID:
+            with self.subTest(dt_str=dt_str):
+                self.assertEqual(TimestampParser().parse_fields(dt_str), strptime_fields(dt_str))
+                self.assertEqual(TimestampParser().parse(dt_str), datetime.datetime.strptime(dt_str, DT_FORMAT))
+
+    def test_same_minute_fast_path(self):
+        parser = TimestampParser()
+        lines = [f"2024-03-10 14:25:{second:02d} -0000" for second in range(60)]
+        lines += ["2024-03-10 14:25:59 +0100", "2024-03-10 14:26:00 +0100", "2024-03-10 14:26:00 +0100"]
+        for dt_str in lines:
+            with self.subTest(dt_str=dt_str):
+                self.assertEqual(parser.parse_fields(dt_str), strptime_fields(dt_str))
+
+    def test_same_minute_invalid_seconds(self):
+        parser = TimestampParser()
+        parser.parse_fields("2024-03-10 14:25:00 +0300")
+        for dt_str in ("2024-03-10 14:25:60 +0300", "2024-03-10 14:25:+1 +0300", "2024-03-10 14:25:٣٣ +0300"):
+            with self.subTest(dt_str=dt_str), self.assertRaises(ValueError):
+                parser.parse_fields(dt_str)
+        # После ошибки кэш минуты по-прежнему даёт верный результат
+        self.assertEqual(parser.parse_fields("2024-03-10 14:25:01 +0300"),
+                         strptime_fields("2024-03-10 14:25:01 +0300"))
+
+    def test_invalid_raises_value_error(self):
+        for dt_str in self.INVALID:
+            with self.subTest(dt_str=dt_str), self.assertRaises(ValueError):
+                TimestampParser().parse_fields(dt_str)
+
+    def test_parser_per_thread(self):
+        parsers = []
+        thread = threading.Thread(target=lambda: parsers.extend([get_timestamp_parser(), get_timestamp_parser()]))
+        thread.start()
+        thread.join()
+        self.assertIs(parsers[0], parsers[1])
+        self.assertIsNot(parsers[0], get_timestamp_parser())
+        self.assertIs(get_timestamp_parser(), get_timestamp_parser())
+
+
+class LineChunkTests(SimpleTestCase):
+    """Разбиение потока байт на строки: границы блоков, CRLF, последняя строка без перевода."""
+
+    LINES = ["first", "", "второй", "third line", "x" * 50, "last"]
+
+    def data(self, newline=b'\n', trailing=True):
+        data = newline.join(line.encode() for line in self.LINES)
+        return data + newline if trailing else data
+
+    def test_split_line_blocks_any_block_size(self):
+        for newline in (b'\n', b'\r\n'):
+            for trailing in (True, False):
+                data = self.data(newline, trailing)
+                for size in (1, 2, 3, 7, len(data)):
+                    with self.subTest(newline=newline, trailing=trailing, size=size):
+                        blocks = [data[i:i + size] for i in range(0, len(data), size)]
+                        chunks = list(split_line_blocks(blocks, 4))
+                        self.assertEqual([line for lines, offset in chunks for line in lines], self.LINES)
+                        self.assertTrue(all(len(lines) == 4 for lines, offset in chunks[:-1]))
+                        # Смещения совпадают с read_line_chunks
+                        self.assertEqual(chunks, list(read_line_chunks(io.BytesIO(data), 4)))
+
+    def test_split_line_blocks_empty(self):
+        self.assertEqual(list(split_line_blocks([], 4)), [])
+        self.assertEqual(list(split_line_blocks([b''], 4)), [])
+
+    def test_skip_bytes(self):
+        data = self.data()
+        blocks = [data[i:i + 5] for i in range(0, len(data), 5)]
+        for count in (0, 3, 5, 17, len(data), len(data) + 1):
+            with self.subTest(count=count):
+                self.assertEqual(b''.join(skip_bytes(blocks, count)), data[count:])
+
+    def test_read_line_blocks_end_on_newline(self):
+        data = self.data()
+        for size in (1, 4, 9):
+            with self.subTest(size=size):
+                blocks = list(read_line_blocks(io.BytesIO(data), size))
+                self.assertEqual(b''.join(blocks), data)
+                self.assertTrue(all(block.endswith(b'\n') for block in blocks))
+
+    def test_read_line_chunks_offsets(self):
+        for newline in (b'\n', b'\r\n'):
+            for trailing in (True, False):
+                data = self.data(newline, trailing)
+                with self.subTest(newline=newline, trailing=trailing):
+                    chunks = list(read_line_chunks(io.BytesIO(data), 4))
+                    self.assertEqual([line for lines, offset in chunks for line in lines], self.LINES)
+                    self.assertEqual(chunks[-1][1], len(data))
+                    # Смещение после порции - граница строки: с него продолжается чтение
+                    offset = chunks[0][1]
+                    self.assertTrue(data[:offset].endswith(b'\n'))
+                    rest = list(read_line_chunks(io.BytesIO(data[offset:]), 4, offset))
+                    self.assertEqual(rest, chunks[1:])
+
+
+class IngestLedgerTests(TestCase):
+    """Журнал IngestedFile: загруженное не загружается повторно, дописанное - продолжается."""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'access.log')
+        self.loaded = []
+
+    def write(self, lines, mode='a'):
+        with open(self.path, mode + 'b') as f:
+            f.write(''.join(line + '\n' for line in lines).encode())
+
+    def ingest(self):
+        return ingest_file(self.path, lambda lines, server: self.loaded.extend(lines),
+                           chunk_size=7, log=lambda message: None)
+
+    def test_completed_file_is_skipped(self):
+        self.write([f"line {i}" for i in range(20)], 'w')
+        self.assertEqual(self.ingest(), 20)
+        self.assertIsNone(self.ingest())
+        self.assertEqual(self.loaded, [f"line {i}" for i in range(20)])
+        entry = IngestedFile.objects.get()
+        self.assertTrue(entry.completed)
+        self.assertEqual((entry.offset, entry.line_count), (os.path.getsize(self.path), 20))
+
+    def test_generation_bumped_once_per_file(self):
+        self.write([f"line {i}" for i in range(20)], 'w')
+        generation = current_generation()
+        self.ingest()
+        self.assertEqual(current_generation(), generation + 1)
+        self.ingest()
+        self.assertEqual(current_generation(), generation + 1)
+
+    def test_small_file_growth_continues_from_offset(self):
+        self.write([f"line {i}" for i in range(20)], 'w')
+        self.ingest()
+        self.write([f"line {i}" for i in range(20, 30)])
+        self.assertEqual(self.ingest(), 10)
+        self.assertEqual(self.loaded, [f"line {i}" for i in range(30)])
+        self.assertEqual(IngestedFile.objects.get().line_count, 30)
+
+    def test_large_file_growth_continues_from_offset(self):
+        line = "x" * 99
+        count = FINGERPRINT_BLOCK // 100 + 10
+        self.write([line] * count, 'w')
+        self.ingest()
+        self.write(["tail"])
+        self.assertEqual(self.ingest(), 1)
+        self.assertEqual(len(self.loaded), count + 1)
+        self.assertEqual(IngestedFile.objects.count(), 1)
+
+    def test_replaced_file_is_loaded_from_start(self):
+        self.write([f"line {i}" for i in range(20)], 'w')
+        self.ingest()
+        self.write([f"other {i}" for i in range(25)], 'w')
+        self.assertEqual(self.ingest(), 25)
+        self.assertEqual(IngestedFile.objects.count(), 2)
+
+    def test_followed_lines_are_not_loaded_again(self):
+        self.write([f"line {i}" for i in range(5)], 'w')
+        entry = get_ledger_entry(self.path)
+        with open(self.path, 'rb') as f:
+            advance_ledger_entry(entry, f, os.path.getsize(self.path), 5)
+        self.assertIsNone(self.ingest())
+        # Дописанное после слежения загружается с места остановки
+        self.write(["line 5"])
+        self.assertEqual(get_ledger_entry(self.path).pk, entry.pk)
+        self.assertEqual(self.ingest(), 1)
+        self.assertEqual(self.loaded, ["line 5"])
+
+    def test_followed_empty_files_keep_separate_entries(self):
+        other = os.path.join(os.path.dirname(self.path), 'other.log')
+        for path in (self.path, other):
+            open(path, 'wb').close()
+        entries = [get_ledger_entry(self.path), get_ledger_entry(other)]
+        self.assertNotEqual(entries[0].pk, entries[1].pk)
+        # Оба файла растут одинаково, а слежение продвигает записи по очереди
+        for path, entry, count in ((self.path, entries[0], 3), (other, entries[1], 1)):
+            with open(path, 'ab') as f:
+                f.write(''.join(f"line {i}\n" for i in range(count)).encode())
+            with open(path, 'rb') as f:
+                advance_ledger_entry(entry, f, os.path.getsize(path), count)
+        # После перезапуска каждый файл продолжается со своего смещения
+        self.write(["line 3"])
+        entry = get_ledger_entry(self.path)
+        self.assertEqual((entry.pk, entry.offset, entry.line_count), (entries[0].pk, 21, 3))
+        self.assertEqual(self.ingest(), 1)
+        self.assertEqual(self.loaded, ["line 3"])
+        self.assertEqual(get_ledger_entry(other).offset, 7)
+
+    def test_same_short_content_at_different_paths(self):
+        other = os.path.join(os.path.dirname(self.path), 'other.log')
+        self.write(["same"], 'w')
+        with open(other, 'wb') as f:
+            f.write(b"same\n")
+        self.assertEqual(self.ingest(), 1)
+        self.assertEqual(ingest_file(other, lambda lines, server: self.loaded.extend(lines),
+                                     log=lambda message: None), 1)
+        self.assertEqual(IngestedFile.objects.count(), 2)
+
+
+class IngestStreamLedgerTests(TestCase):
+    """Загрузка потоком ведёт тот же журнал: повторные данные пропускаются."""
+
+    def setUp(self):
+        self.loaded = []
+
+    def ingest(self, blocks, name='upload.log', **kwargs):
+        return ingest_stream(blocks, name, lambda lines, server: self.loaded.extend(lines),
+                             chunk_size=3, log=lambda message: None, **kwargs)
+
+    def test_same_data_is_skipped(self):
+        data = b"".join(f"line {i}\n".encode() for i in range(10))
+        self.assertEqual(self.ingest([data[:13], data[13:]]), 10)
+        self.assertIsNone(self.ingest([data]))
+        self.assertIsNone(self.ingest([data], name='renamed.log'))
+        self.assertEqual(len(self.loaded), 10)
+        entry = IngestedFile.objects.get()
+        self.assertEqual((entry.offset, entry.line_count, entry.completed), (len(data), 10, True))
+
+    def test_compressed_stream(self):
+        data = b"".join(f"line {i}\n".encode() for i in range(10))
+        compressed = gzip.compress(data)
+        self.assertEqual(self.ingest([compressed[:7], compressed[7:]], name='upload.log.gz'), 10)
+        self.assertIsNone(self.ingest([compressed], name='upload.log.gz'))
+        self.assertEqual(IngestedFile.objects.get().offset, len(data))
+
+    def test_interrupted_load_resumes(self):
+        data = b"".join(f"line {i}\n".encode() for i in range(10))
+
+        def fail_on_second_chunk(lines, server):
+            if self.loaded:
+                raise RuntimeError("сбой")
+            self.loaded.extend(lines)
+
+        with self.assertRaises(RuntimeError):
+            ingest_stream([data], 'upload.log', fail_on_second_chunk, chunk_size=3, log=lambda message: None)
+        self.assertEqual(self.ingest([data]), 7)
+        self.assertEqual(self.loaded, [f"line {i}" for i in range(10)])
+
+    def test_file_loaded_before_is_skipped(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'access.log')
+            with open(path, 'wb') as f:
+                f.write(b"".join(f"line {i}\n".encode() for i in range(10)))
+            ingest_file(path, lambda lines, server: None, log=lambda message: None)
+            with open(path, 'rb') as f:
+                self.assertIsNone(self.ingest([f.read()], fingerprint=file_fingerprint(path)))
+        self.assertEqual(self.loaded, [])
+
+class LatencySketchTests(SimpleTestCase):
+    """Квантили LatencySketch - в пределах относительной ошибки; скетчи объединяются без потерь."""
+
+    def setUp(self):
+        rng = random.Random(42)
+        self.values = [rng.lognormvariate(5, 1.5) for _ in range(5000)] + [0.0] * 50
+
+    def assert_quantiles(self, sketch, values):
+        ordered = sorted(values)
+        for q in (0, 0.01, 0.25, 0.5, 0.9, 0.99, 1):
+            with self.subTest(q=q):
+                exact = ordered[math.floor(q * (len(ordered) - 1))]
+                estimate = sketch.quantile(q)
+                self.assertLessEqual(abs(estimate - exact), sketch.relative_accuracy * exact + 1e-9)
+
+    def test_quantiles_within_relative_accuracy(self):
+        sketch = LatencySketch()
+        sketch.add_many(self.values + [None, float('nan')])
+        self.assertEqual(sketch.count, len(self.values))
+        self.assert_quantiles(sketch, self.values)
+
+    def test_merge_equals_single_sketch(self):
+        whole = LatencySketch()
+        whole.add_many(self.values)
+        merged = LatencySketch()
+        for i in range(0, len(self.values), 1000):
+            part = LatencySketch()
+            part.add_many(self.values[i:i + 1000])
+            merged.merge(part)
+        self.assertEqual((merged.bins, merged.zero_count), (whole.bins, whole.zero_count))
+        self.assert_quantiles(merged, self.values)
+        with self.assertRaises(ValueError):
+            merged.merge(LatencySketch(relative_accuracy=0.02))
+
+    def test_serialization_round_trip(self):
+        sketch = LatencySketch()
+        sketch.add_many(self.values)
+        restored = LatencySketch.from_bytes(sketch.to_bytes())
+        self.assertEqual((restored.bins, restored.zero_count), (sketch.bins, sketch.zero_count))
+        empty = LatencySketch.from_bytes(LatencySketch().to_bytes())
+        self.assertEqual(empty.count, 0)
+        self.assertIsNone(empty.quantile(0.5))
+
+
+class UniqueSketchTests(SimpleTestCase):
+    """UniqueSketch: оценка в пределах нескольких стандартных ошибок, объединение = скетч объединения."""
+
+    def test_count_accuracy(self):
+        for n in (0, 10, 1000, 50000):
+            with self.subTest(n=n):
+                sketch = UniqueSketch()
+                values = [f"10.0.{i % 256}.{i // 256}|agent" for i in range(n)]
+                sketch.add_many(values + values[:n // 2])
+                # Стандартная ошибка ~0.8%, берём с запасом
+                self.assertLessEqual(abs(sketch.count - n), max(1, 0.03 * n))
+
+    def test_merge_equals_union(self):
+        first = [f"ip-{i}" for i in range(0, 30000)]
+        second = [f"ip-{i}" for i in range(20000, 50000)]
+        merged = UniqueSketch()
+        merged.add_many(first)
+        part = UniqueSketch()
+        part.add_many(second)
+        merged.merge(part)
+        union = UniqueSketch()
+        union.add_many(first + second)
+        self.assertTrue((merged.registers == union.registers).all())
+        self.assertLessEqual(abs(merged.count - 50000), 0.03 * 50000)
+        with self.assertRaises(ValueError):
+            merged.merge(UniqueSketch(precision=12))
+
+    def test_serialization_round_trip(self):
+        sketch = UniqueSketch()
+        sketch.add_many(f"ip-{i}" for i in range(5000))
+        restored = UniqueSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.precision, sketch.precision)
+        self.assertTrue((restored.registers == sketch.registers).all())
+        self.assertEqual(restored.count, sketch.count)
+
+
+class UniqueCountTests(TestCase):
+    """unique_count дополняет отстающие скетчи, а не отвечает по старым."""
+
+    def setUp(self):
+        self.moment = DimDateTime.objects.create(
+            log_date=datetime.date(2024, 3, 10), log_time=datetime.time(14, 25), year=2024, month=3, day=10,
+            hour=14, minute=25, second=0, utc_offset='+0300')
+        self.request = DimRequest.objects.create(method='GET', path='/', http_version='HTTP/1.1')
+
+    def add_facts(self, ips):
+        FactLog.objects.bulk_create([
+            FactLog(ip=DimIP.objects.get_or_create(ip_address=ip)[0], datetime_entry=self.moment,
+                    request=self.request, status_code=200, bytes_sent=0, server='Server A')
+            for ip in ips
+        ])
+
+    def test_catches_up_with_new_facts(self):
+        self.add_facts([f"10.0.0.{i % 12}" for i in range(30)])
+        self.assertEqual(unique_count(), 12)
+        self.add_facts(["10.0.0.1", "10.0.1.1", "10.0.1.2", "10.0.1.3"])
+        self.assertEqual(unique_count(), 15)